@@ -0,0 +1,175 @@
+# answer_cache.py - Cache das respostas do LLM para perguntas repetidas
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from text_analysis import fold_accents
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r'\w+')
+
+class AnswerCache:
+    """
+    Respostas do LLM indexadas por (pergunta normalizada, chunks do contexto, versão do corpus)
+    - memória: no máximo max_entries respostas, com despejo LRU e validade de ttl segundos
+    - disco (opcional): um arquivo JSON por resposta em cache_dir, compartilhado entre os workers;
+      limitado a max_disk_entries e à mesma validade
+    Qualquer gravação no armazenamento (upload, remoção) muda a versão do corpus: as respostas
+    anteriores deixam de ser encontradas e a camada em memória é esvaziada
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, cache_dir=None, max_disk_entries=10000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache_dir = cache_dir
+        self.max_disk_entries = max_disk_entries
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        # chave → (resposta, criada em, segundos gastos pelo LLM)
+        self._entries = OrderedDict()
+        self._corpus_version = None
+        self._disk_writes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def normalize(question):
+        """Minúsculas, sem acentos nem pontuação: 'Quando começa o semestre?' → 'quando comeca o semestre'"""
+        return ' '.join(_WORD_RE.findall(fold_accents(question.lower())))
+
+    def _key(self, question, chunk_ids, corpus_version, scope):
+        payload = json.dumps([self.normalize(question), list(chunk_ids), corpus_version, scope])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def _check_version(self, corpus_version):
+        """Esvazia a camada em memória quando o corpus muda (chamado com a trava)"""
+        if corpus_version != self._corpus_version:
+            if self._entries:
+                logger.info(f"Corpus alterado: {len(self._entries)} respostas em cache invalidadas")
+            self._entries.clear()
+            self._corpus_version = corpus_version
+
+    def _remember(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, question, chunk_ids, corpus_version, scope=''):
+        """Resposta em cache, ou None; scope separa prompts diferentes para o mesmo contexto"""
+        key = self._key(question, chunk_ids, corpus_version, scope)
+        now = time.time()
+
+        with self._lock:
+            self._check_version(corpus_version)
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[1] > self.ttl:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self.saved_seconds += entry[2]
+                return entry[0]
+
+        entry = self._read(key, now)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._remember(key, entry)
+            self.disk_hits += 1
+            self.saved_seconds += entry[2]
+            return entry[0]
+
+    def put(self, question, chunk_ids, corpus_version, answer, latency, scope=''):
+        """Guarda a resposta e o tempo (segundos) que o LLM levou para produzi-la"""
+        key = self._key(question, chunk_ids, corpus_version, scope)
+        entry = (answer, time.time(), latency)
+        with self._lock:
+            self._check_version(corpus_version)
+            self._remember(key, entry)
+        self._write(key, entry)
+
+    def _read(self, key, now):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(key), encoding='utf-8') as cached:
+                record = json.load(cached)
+        except (FileNotFoundError, ValueError):
+            return None
+        if now - record['created_at'] > self.ttl:
+            return None
+        return record['answer'], record['created_at'], record['latency']
+
+    def _write(self, key, entry):
+        if not self.cache_dir:
+            return
+        answer, created_at, latency = entry
+        staged = None
+        try:
+            fd, staged = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as cached:
+                json.dump({'answer': answer, 'created_at': created_at, 'latency': latency}, cached,
+                          ensure_ascii=False)
+            os.replace(staged, self._path(key))
+        except OSError as e:
+            logger.error(f"Erro ao gravar resposta em cache: {e}")
+            if staged and os.path.exists(staged):
+                os.unlink(staged)
+            return
+
+        with self._lock:
+            self._disk_writes += 1
+            prune = self._disk_writes % 100 == 0
+        if prune:
+            self._prune_disk()
+
+    def _prune_disk(self):
+        """Remove do disco as respostas vencidas e as mais antigas além de max_disk_entries"""
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                entries.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+        entries.sort(reverse=True)
+        for position, (modified, path) in enumerate(entries):
+            if position >= self.max_disk_entries or now - modified > self.ttl:
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        """Taxa de acerto e tempo de LLM economizado neste processo"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'disk': bool(self.cache_dir),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                'saved_seconds': round(self.saved_seconds, 3)
+            }
@@ -1,11 +1,29 @@
 # app.py - RAG Simplificado com Sistema de Autenticação Completo
 import os
 import json
+import time
+import zipfile
+import threading
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from groq import Groq
 from dotenv import load_dotenv
+from search_index import InvertedIndex
+from index_snapshot import IndexSnapshots
+from sparse_index import SparseIndex, SPARSE_AVAILABLE
+from dense_index import DenseIndex, DENSE_AVAILABLE
+from retrieval import HybridRetriever
+from sharded_search import ShardedSearcher
+from text_analysis import analyze, analyze_positions
+from chunk_store import ChunkStore
+from ingestion import (ingest_document, iter_pdf_pages, FixedSizeSplitter, SentenceSplitter, ParallelPageExtractor,
+                       ExtractionCache)
+from tokenization import TokenCounter
+from context_packing import ContextPacker
+from answer_cache import AnswerCache
+from ingestion_queue import IngestionQueue, IngestionBatch, UploadTooLargeError
+from database_utils import DatabaseManager
 import logging
 
 # Configuração do sistema de logging para monitoramento da aplicação
@@ -33,7 +51,6 @@ try:
     from auth import AuthManager, token_required, admin_required
     from auth_routes import init_auth_routes
     from admin_routes import init_admin_routes
-    from database_utils import DatabaseManager
     
     # Inicialização do sistema de autenticação e banco de dados
     auth_manager = AuthManager(app)
@@ -57,56 +74,487 @@ except ImportError as e:
     auth_manager = None
     db_manager = None
 
-# Armazenamento em memória para documentos processados
-# Em produção, considera-se migrar para banco de dados persistente
-document_store = []
+# Armazenamento persistente dos chunks processados (append-only, mapeado em memória)
+# Sobrevive a reinicializações e deploys sem novo upload dos PDFs
+DATA_DIR = os.getenv('DATA_DIR', 'data')
+document_store = ChunkStore(DATA_DIR)
 
-def simple_text_splitter(text, chunk_size=1000, overlap=200):
+# Índice de busca sobre o document_store, atualizado incrementalmente a cada upload
+# SEARCH_BACKEND=sparse usa a matriz esparsa vetorizada (requer numpy/scipy)
+# SEARCH_SHARDS=N (N > 1) particiona o índice léxico entre N processos (scatter-gather), iniciados
+# na primeira consulta de cada worker do gunicorn: são workers × N processos, cada um com a sua parte
+# do índice; com shards, prefira poucos workers com várias threads (ex.: -w 1 --threads 8)
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'inverted')
+SEARCH_SHARDS = int(os.getenv('SEARCH_SHARDS', '0'))
+
+if SEARCH_SHARDS > 1:
+    search_index = ShardedSearcher(DATA_DIR, SEARCH_SHARDS)
+elif SEARCH_BACKEND == 'sparse' and SPARSE_AVAILABLE:
+    search_index = SparseIndex()
+else:
+    if SEARCH_BACKEND == 'sparse':
+        logger.warning("numpy/scipy não disponíveis, usando índice invertido")
+    search_index = InvertedIndex()
+
+# Chunks com score BM25 abaixo desta fração do melhor resultado não são enviados ao LLM
+SEARCH_MIN_SCORE_RATIO = float(os.getenv('SEARCH_MIN_SCORE_RATIO', '0.5'))
+
+# RETRIEVAL_MODE=dense usa a busca vetorial local (requer numpy) no lugar das palavras-chave,
+# recuperando perguntas parafraseadas sem depender de rede
+# RETRIEVAL_MODE=hybrid executa as duas buscas em paralelo e funde os rankings (RRF)
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'lexical')
+DENSE_MIN_SIMILARITY = float(os.getenv('DENSE_MIN_SIMILARITY', '0.2'))
+
+# Orçamento por pergunta da recuperação híbrida: candidatos avaliados e latência máxima
+RETRIEVAL_CANDIDATES = int(os.getenv('RETRIEVAL_CANDIDATES', '20'))
+RETRIEVAL_TIMEOUT_MS = int(os.getenv('RETRIEVAL_TIMEOUT_MS', '300'))
+
+dense_index = None
+if RETRIEVAL_MODE in ('dense', 'hybrid'):
+    if DENSE_AVAILABLE:
+        dense_index = DenseIndex()
+    else:
+        logger.warning("numpy não disponível, usando busca por palavras-chave")
+
+# Frases entre aspas e o bônus de proximidade dependem das posições do índice invertido (ou dos shards)
+if isinstance(search_index, SparseIndex):
+    logger.warning("SEARCH_BACKEND=sparse não usa posições: trechos entre aspas são buscados como termos "
+                   "soltos e não há bônus de proximidade")
+if dense_index is not None:
+    logger.warning(f"RETRIEVAL_MODE={RETRIEVAL_MODE}: a busca vetorial ignora trechos entre aspas"
+                   + (" (a restrição de frase vale apenas para a parte léxica da fusão)" if RETRIEVAL_MODE == 'hybrid' else ""))
+
+# Índices alimentados por este processo em sync_indexes (os shards indexam o armazenamento por conta própria)
+local_indexes = [index for index in (search_index, dense_index)
+                 if index is not None and not isinstance(index, ShardedSearcher)]
+
+hybrid_retriever = None
+if RETRIEVAL_MODE == 'hybrid' and dense_index is not None:
+    hybrid_retriever = HybridRetriever({
+        'lexical': lambda query, limit: search_index.search(query, limit),
+        'dense': lambda query, limit: dense_index.search(analyze(query), limit, DENSE_MIN_SIMILARITY)
+    })
+
+# Divisão dos documentos em chunks: CHUNK_TOKENS > 0 divide por frases e parágrafos em chunks de até
+# CHUNK_TOKENS tokens (contados localmente), repetindo até CHUNK_OVERLAP_TOKENS do chunk anterior;
+# CHUNK_TOKENS=0 mantém a divisão em blocos fixos de 1000 caracteres
+CHUNK_TOKENS = int(os.getenv('CHUNK_TOKENS', '256'))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '32'))
+token_counter = TokenCounter(os.getenv('TOKENIZER_ENCODING', 'cl100k_base'))
+
+def make_splitter():
+    """Divisor para um novo documento, conforme CHUNK_TOKENS"""
+    if CHUNK_TOKENS > 0:
+        return SentenceSplitter(CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, token_counter)
+    return FixedSizeSplitter()
+
+def build_results(hits, documents):
+    """Converte pares (chunk_id, score) no formato de resultado usado pelos endpoints de chat"""
+    results = []
+    
+    for chunk_id, score in hits:
+        doc = documents[chunk_id]
+        content = doc['content']
+        results.append({
+            'chunk_id': chunk_id,
+            'content': content,
+            'filename': doc['filename'],
+            'score': round(score, 4),
+            'tokens': doc.token_count or token_counter.count(content)
+        })
+    
+    return results
+
+def simple_search(query, documents, max_results=3):
+    """
+    Sistema de busca por relevância com ranking BM25
+    Consulta o índice invertido, visitando apenas os chunks que contêm os termos da pergunta;
+    trechos entre aspas são buscados como frase e termos próximos como na pergunta pontuam mais
     """
-    Implementação de divisor de texto para otimizar processamento de documentos grandes
-    Divide texto em chunks com sobreposição para manter contexto entre segmentos
+    return build_results(search_index.search(query, max_results, SEARCH_MIN_SCORE_RATIO), documents)
+
+def dense_search(query, documents, max_results=3):
     """
-    chunks = []
-    start = 0
+    Busca vetorial aproximada: embedding local da pergunta consultado no índice LSH
+    Retorna a similaridade de cosseno como score
+    """
+    return build_results(dense_index.search(analyze(query), max_results, DENSE_MIN_SIMILARITY), documents)
+
+def hybrid_search(query, documents, max_results=3):
+    """
+    Busca léxica e vetorial em paralelo, fundidas por rank recíproco
+    Aumenta a revocação mantendo o mesmo número de chunks enviados ao LLM
+    """
+    hits = hybrid_retriever.retrieve(query, max_results, RETRIEVAL_CANDIDATES, RETRIEVAL_TIMEOUT_MS)
+    return build_results([(chunk_id, score) for chunk_id, score, _ in hits], documents)
+
+def retrieve(question, max_results=3):
+    """Seleciona os chunks de contexto para a pergunta conforme o RETRIEVAL_MODE configurado"""
+    sync_indexes(blocking=False)
+    if hybrid_retriever is not None:
+        return hybrid_search(question, document_store, max_results)
+    if dense_index is not None:
+        return dense_search(question, document_store, max_results)
+    return simple_search(question, document_store, max_results)
+
+# Montagem do contexto: até CONTEXT_CANDIDATES chunks recuperados são fundidos em trechos
+# e incluídos por relevância até CONTEXT_TOKEN_BUDGET tokens
+CONTEXT_CANDIDATES = int(os.getenv('CONTEXT_CANDIDATES', '6'))
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '1024'))
+context_packer = ContextPacker(document_store, token_counter, CONTEXT_TOKEN_BUDGET)
+
+def build_context(search_results):
+    """Contexto para o prompt e fontes exibidas ao usuário, a partir dos resultados da busca"""
+    passages = context_packer.pack(search_results)
+    sources = []
     
-    while start < len(text):
-        end = start + chunk_size
-        chunk = text[start:end]
-        
-        if chunk:
-            chunks.append(chunk)
-        
-        start = end - overlap
-        if start >= len(text):
-            break
+    for passage in passages:
+        sources.append({
+            'nome do arquivo': passage['filename'],
+            'score': passage['score'],
+            'tokens': passage['tokens'],
+            'conteudo': passage['content'][:200] + "..." if len(passage['content']) > 200 else passage['content']
+        })
     
-    return chunks
+    chunk_ids = [chunk_id for passage in passages for chunk_id in passage['chunk_ids']]
+    return context_packer.context(passages), sources, chunk_ids
 
-def simple_search(query, documents, max_results=3):
+# Cache das respostas do LLM: ANSWER_CACHE_SIZE respostas em memória (0 desativa) válidas por
+# ANSWER_CACHE_TTL segundos; ANSWER_CACHE_DISK=true mantém também uma cópia em disco, compartilhada
+# entre os workers e preservada entre reinicializações
+ANSWER_CACHE_SIZE = int(os.getenv('ANSWER_CACHE_SIZE', '1024'))
+ANSWER_CACHE_TTL = int(os.getenv('ANSWER_CACHE_TTL', '3600'))
+ANSWER_CACHE_DISK = os.getenv('ANSWER_CACHE_DISK', 'false').lower() in ('1', 'true', 'yes')
+
+answer_cache = None
+if ANSWER_CACHE_SIZE > 0:
+    answer_cache = AnswerCache(
+        ANSWER_CACHE_SIZE,
+        ANSWER_CACHE_TTL,
+        os.path.join(DATA_DIR, 'answers') if ANSWER_CACHE_DISK else None
+    )
+
+def cached_answer(question, chunk_ids, corpus_version, scope=''):
     """
-    Sistema de busca por relevância baseado em contagem de palavras-chave
-    Implementa scoring simples mas eficaz para recuperação de informações
+    Resposta já guardada para a pergunta, ou None
+    A chave combina a pergunta normalizada, os chunks do contexto e a versão do corpus
     """
-    query_words = query.lower().split()
-    results = []
+    if answer_cache is None:
+        return None
+    return answer_cache.get(question, chunk_ids, corpus_version, scope)
+
+def remember_answer(question, chunk_ids, corpus_version, answer, latency, scope=''):
+    if answer_cache is not None:
+        answer_cache.put(question, chunk_ids, corpus_version, answer, latency, scope)
+
+def generate_answer(prompt, question, chunk_ids, scope=''):
+    """
+    Resposta do LLM para o prompt, consultando antes os caches de respostas
+    Retorna (resposta, True se veio de um cache); erros do Groq não são guardados
+    """
+    corpus_version = document_store.version
+    answer = cached_answer(question, chunk_ids, corpus_version, scope)
+    if answer is not None:
+        return answer, True
     
-    for doc in documents:
-        score = 0
-        content_lower = doc['content'].lower()
+    started = time.perf_counter()
+    try:
+        response = client.chat.completions.create(
+            model="llama3-8b-8192",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=1000,
+            temperature=0.3
+        )
         
-        for word in query_words:
-            score += content_lower.count(word)
+        answer = response.choices[0].message.content
         
-        if score > 0:
-            results.append({
-                'content': doc['content'],
-                'filename': doc['filename'],
-                'score': score
-            })
+    except Exception as e:
+        logger.error(f"Erro no Groq: {e}")
+        return f"Erro ao processar resposta: {str(e)}", False
+    
+    remember_answer(question, chunk_ids, corpus_version, answer, time.perf_counter() - started, scope)
+    return answer, False
+
+def sse_event(event, data):
+    """Um evento no formato Server-Sent Events, com os dados em JSON"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def stream_answer(prompt, question, chunk_ids, metadata, scope=''):
+    """
+    Gerador de eventos SSE para a resposta do LLM:
+    - 'sources': metadata (fontes e trecho do contexto), enviado antes de chamar o LLM
+    - 'token': {'content': texto} a cada fragmento recebido do Groq (stream=True); uma resposta
+      em cache é enviada em um único evento
+    - 'done': {'cached': bool} ao fim, ou 'error': {'error': mensagem} se o Groq falhar
+    Cada fragmento é repassado assim que chega; só o texto acumulado é mantido, para o cache
+    """
+    yield sse_event('sources', metadata)
+    
+    corpus_version = document_store.version
+    answer = cached_answer(question, chunk_ids, corpus_version, scope)
+    if answer is not None:
+        yield sse_event('token', {'content': answer})
+        yield sse_event('done', {'cached': True})
+        return
     
-    # Ordenação por relevância para retornar os resultados mais pertinentes
-    results.sort(key=lambda x: x['score'], reverse=True)
-    return results[:max_results]
+    started = time.perf_counter()
+    parts = []
+    stream = None
+    try:
+        stream = client.chat.completions.create(
+            model="llama3-8b-8192",
+            messages=[{"role": "user", "content": prompt}],
+            max_tokens=1000,
+            temperature=0.3,
+            stream=True
+        )
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            content = chunk.choices[0].delta.content
+            if content:
+                parts.append(content)
+                yield sse_event('token', {'content': content})
+    except Exception as e:
+        logger.error(f"Erro no Groq: {e}")
+        yield sse_event('error', {'error': f"Erro ao processar resposta: {str(e)}"})
+        return
+    finally:
+        # Se o cliente desconectar, o gerador é fechado aqui e a conexão com o Groq é encerrada
+        if stream is not None and hasattr(stream, 'close'):
+            stream.close()
+    
+    remember_answer(question, chunk_ids, corpus_version, ''.join(parts), time.perf_counter() - started, scope)
+    yield sse_event('done', {'cached': False})
+
+def sse_response(events):
+    """Resposta HTTP que envia os eventos à medida que são gerados (sem buffer em proxies)"""
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Por índice de busca: [chunks do document_store já indexados, documentos removidos já marcados]
+index_progress = {index: [0, 0] for index in local_indexes}
+index_lock = threading.Lock()
+
+# Chunks indexados por vez: entre os lotes a trava é liberada e as buscas usam o índice parcial
+INDEX_BATCH_SIZE = int(os.getenv('INDEX_BATCH_SIZE', '500'))
+
+# Segmentos do índice invertido compartilhados entre os workers (mmap): após INDEX_SNAPSHOT_EVERY
+# chunks indexados ou removidos, o índice é gravado em DATA_DIR/index e os demais workers passam a
+# usá-lo no lugar das suas listas em memória; um worker reiniciado abre o segmento mais recente.
+# INDEX_SNAPSHOT_EVERY=0 desativa (cada worker mantém o próprio índice)
+INDEX_SNAPSHOT_EVERY = int(os.getenv('INDEX_SNAPSHOT_EVERY', '1000'))
+index_snapshots = None
+if INDEX_SNAPSHOT_EVERY > 0 and isinstance(search_index, InvertedIndex):
+    index_snapshots = IndexSnapshots(os.path.join(DATA_DIR, 'index'))
+# Chunks indexados ou removidos no search_index desde o último segmento usado
+snapshot_changes = 0
+
+# Sinaliza à thread de compactação que há chunks removidos nos índices
+compaction_requested = threading.Event()
+
+def _adopt_index_snapshot():
+    """Passa o search_index para o segmento publicado mais recente, se ele já inclui tudo o que o índice tem"""
+    global snapshot_changes
+
+    segment = index_snapshots.latest()
+    if segment is None:
+        return
+    progress = index_progress[search_index]
+    if (segment.chunks < progress[0] or segment.deletions < progress[1]
+            or segment.chunks > len(document_store) or segment.deletions > len(document_store.deleted_documents)):
+        return
+    search_index.load_segment(segment)
+    progress[:] = [segment.chunks, segment.deletions]
+    snapshot_changes = 0
+    logger.info(f"Índice de busca carregado do segmento {os.path.basename(segment.path)}: {segment.chunks} chunks")
+
+def _publish_index_snapshot():
+    """Grava o search_index como um segmento compartilhado e passa a usá-lo (outro worker pode já estar gravando)"""
+    global snapshot_changes
+
+    chunks, deletions = index_progress[search_index]
+    try:
+        segment = index_snapshots.publish(search_index, chunks, deletions)
+    except Exception as e:
+        logger.error(f"Erro ao gravar o segmento do índice: {e}")
+        return
+    if segment is not None:
+        search_index.load_segment(segment)
+        snapshot_changes = 0
+
+def _sync_batch():
+    """
+    Indexa até INDEX_BATCH_SIZE chunks pendentes; com os chunks em dia, aplica as remoções
+    Chamado com index_lock; retorna True quando os índices estão atualizados
+    """
+    global snapshot_changes
+
+    document_store.refresh()
+    if not local_indexes:
+        return True
+    if index_snapshots is not None:
+        _adopt_index_snapshot()
+
+    total = len(document_store)
+    start = min(chunks for chunks, _ in index_progress.values())
+    end = min(total, start + INDEX_BATCH_SIZE)
+    for chunk_id in range(start, end):
+        # A análise é feita uma vez por chunk, para os índices que ainda não o têm
+        targets = [index for index, (chunks, _) in index_progress.items() if chunks <= chunk_id]
+        tokens, positions = analyze_positions(document_store[chunk_id]['content'])
+        for index in targets:
+            index.add(chunk_id, tokens, positions)
+            if index is search_index:
+                snapshot_changes += 1
+    for progress in index_progress.values():
+        progress[0] = max(progress[0], end)
+
+    if end > start:
+        logger.info(f"Índices de busca atualizados: {end - start} chunks indexados ({end}/{total})")
+    if end < total:
+        return False
+
+    deleted = document_store.deleted_documents
+    first = min(deletions for _, deletions in index_progress.values())
+    if first < len(deleted):
+        for position in range(first, len(deleted)):
+            targets = [index for index, (_, deletions) in index_progress.items() if deletions <= position]
+            for chunk_id in document_store.chunk_range(deleted[position]):
+                tokens = analyze(document_store[chunk_id]['content'])
+                for index in targets:
+                    index.delete(chunk_id, tokens)
+                    if index is search_index:
+                        snapshot_changes += 1
+        for progress in index_progress.values():
+            progress[1] = len(deleted)
+        compaction_requested.set()
+        logger.info(f"Índices de busca atualizados: {len(deleted) - first} documentos removidos")
+
+    if index_snapshots is not None and snapshot_changes >= INDEX_SNAPSHOT_EVERY:
+        _publish_index_snapshot()
+    return True
+
+def sync_indexes(blocking=True):
+    """
+    Indexa os chunks do document_store que ainda não estão nos índices de busca e marca
+    (tombstone) os chunks dos documentos removidos; a compactação fica para segundo plano
+    A análise do texto é feita uma única vez por chunk, em lotes que liberam a trava entre si.
+    blocking=False (buscas): não espera por uma indexação em andamento e processa no máximo um
+    lote, para que a pergunta seja respondida com o índice parcial durante uma reconstrução
+    Retorna True se os índices ficaram atualizados
+    """
+    while True:
+        if not index_lock.acquire(blocking=blocking):
+            return False
+        try:
+            done = _sync_batch()
+        finally:
+            index_lock.release()
+        if done or not blocking:
+            return done
+
+def compact_indexes():
+    """Thread de compactação: retira dos índices as ocorrências dos chunks removidos"""
+    while True:
+        compaction_requested.wait()
+        compaction_requested.clear()
+        for index in local_indexes:
+            try:
+                compacted = index.compact()
+                if compacted:
+                    logger.info(f"{type(index).__name__}: {compacted} chunks removidos compactados")
+            except Exception as e:
+                logger.error(f"Erro na compactação do índice: {e}")
+
+# Extração de texto dos PDFs distribuída entre processos (PDF_EXTRACT_WORKERS=0 ou 1 desativa)
+PDF_EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+page_extractor = None
+if PDF_EXTRACT_WORKERS > 1 and ParallelPageExtractor.available():
+    page_extractor = ParallelPageExtractor(PDF_EXTRACT_WORKERS)
+
+# Os índices são reconstruídos em segundo plano, em lotes, a partir do segmento compartilhado mais
+# recente (se houver): o servidor responde (com o índice parcial) enquanto o corpus é indexado
+threading.Thread(target=sync_indexes, name='index-rebuild', daemon=True).start()
+threading.Thread(target=compact_indexes, name='index-compaction', daemon=True).start()
+
+def extract_pages(stream, page_numbers=None):
+    """Texto das páginas do PDF em staging (ou das informadas), extraídas em paralelo por intervalos quando configurado"""
+    if page_extractor:
+        return page_extractor.iter_pages(stream, page_numbers)
+    return iter_pdf_pages(stream, page_numbers)
+
+def ingest_pages(pages, filename, current_user, progress, splitter=None, file_size=None, file_hash=None):
+    """
+    Executado pelos jobs de ingestão: páginas → divisor incremental → armazenamento,
+    sem o texto completo em memória
+    """
+    doc_id, _, chunk_count = ingest_document(
+        pages,
+        document_store,
+        filename,
+        uploaded_by=current_user['email'] if current_user else None,
+        uploaded_at=str(datetime.now()) if current_user else None,
+        splitter=splitter or make_splitter(),
+        progress=progress,
+        file_size=file_size,
+        file_hash=file_hash
+    )
+    return doc_id, chunk_count
+
+# Os uploads são processados por uma fila em segundo plano (INGEST_WORKERS threads por processo);
+# os jobs são registrados na tabela documents, também quando a autenticação não está disponível
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '1'))
+# O processo que recebe um job renova o seu heartbeat enquanto ele espera ou é processado; jobs sem
+# heartbeat há INGEST_JOB_STALE_SECONDS são considerados interrompidos (processo finalizado)
+INGEST_JOB_STALE_SECONDS = int(os.getenv('INGEST_JOB_STALE_SECONDS', '300'))
+
+jobs_db = db_manager
+if jobs_db is None:
+    jobs_db = DatabaseManager()
+    jobs_db.create_tables()
+
+def remove_document(doc_id):
+    """Remove um documento do armazenamento e marca seu registro na tabela documents"""
+    if not document_store.delete_document(doc_id):
+        return False
+    jobs_db.mark_document_deleted(doc_id)
+    return True
+
+# Uploads em lote: limite de arquivos por requisição e documentos por atualização dos índices
+BULK_UPLOAD_MAX_FILES = int(os.getenv('BULK_UPLOAD_MAX_FILES', '500'))
+# Limites do conteúdo descompactado de um ZIP (e de cada arquivo do lote): tamanho de cada arquivo,
+# tamanho total do arquivo ZIP e taxa de compressão de cada membro
+BULK_UPLOAD_MAX_FILE_BYTES = int(os.getenv('BULK_UPLOAD_MAX_FILE_BYTES', str(100 * 1024 * 1024)))
+BULK_UPLOAD_MAX_TOTAL_BYTES = int(os.getenv('BULK_UPLOAD_MAX_TOTAL_BYTES', str(1024 * 1024 * 1024)))
+BULK_UPLOAD_MAX_RATIO = int(os.getenv('BULK_UPLOAD_MAX_RATIO', '100'))
+INGEST_BATCH_INDEX_EVERY = int(os.getenv('INGEST_BATCH_INDEX_EVERY', '20'))
+
+# Texto extraído de cada PDF, por hash do conteúdo: reenvios não repetem a extração
+extraction_cache = ExtractionCache(os.path.join(DATA_DIR, 'extractions'))
+
+ingestion_queue = IngestionQueue(
+    jobs_db,
+    os.path.join(DATA_DIR, 'uploads'),
+    extract_pages,
+    ingest_pages,
+    sync_indexes,
+    remove=remove_document,
+    extraction_cache=extraction_cache,
+    store=document_store,
+    make_splitter=make_splitter,
+    max_workers=INGEST_WORKERS,
+    stale_seconds=INGEST_JOB_STALE_SECONDS
+)
+
+@app.before_request
+def refresh_document_store():
+    """
+    Cada worker do gunicorn verifica o contador de versão do armazenamento compartilhado
+    Uploads feitos em outro worker ficam visíveis sem reinicialização
+    """
+    document_store.refresh()
 
 @app.route('/', methods=['GET'])
 def home():
@@ -134,6 +582,90 @@ def home():
         'features': features
     })
 
+def prepare_chat(question, current_user=None):
+    """
+    Busca do contexto e montagem do prompt, comuns a /chat, /protected-chat e às variantes em stream
+    Retorna (prompt, sources, chunk_ids, context); sem documentos carregados ou sem resultados
+    relevantes, prompt é None e context traz a mensagem enviada no lugar da resposta do LLM
+    """
+    # Verificação de disponibilidade de documentos no sistema
+    if not document_store:
+        message = 'Ainda não há documentos carregados no sistema.'
+        if current_user is None:
+            message += ' Por favor, faça upload de documentos da UFMA para começar a fazer perguntas.'
+        return None, [], [], message
+    
+    # Execução da busca por documentos relevantes à pergunta
+    search_results = retrieve(question, CONTEXT_CANDIDATES)
+    
+    if not search_results:
+        message = 'Não encontrei informações relevantes nos documentos carregados'
+        return None, [], [], message + (' para responder sua pergunta.' if current_user is None else '.')
+    
+    # Preparação do contexto agregado para o modelo de linguagem
+    context, sources, chunk_ids = build_context(search_results)
+    
+    # Construção do prompt especializado para documentos da UFMA
+    user_line = f"Usuário autenticado: {current_user['name']} ({current_user['email']})\n" if current_user else ''
+    prompt = f"""Você é um assistente especializado em documentos da UFMA (Universidade Federal do Maranhão).
+
+{user_line}Pergunta: {question}
+
+Contexto dos documentos da UFMA:
+{context}
+
+Responda de forma clara e precisa baseando-se apenas nas informações fornecidas dos documentos da UFMA:"""
+    
+    return prompt, sources, chunk_ids, context
+
+def chat_metadata(sources, context, current_user=None):
+    """Fontes e trecho do contexto devolvidos junto com a resposta"""
+    metadata = {
+        'sources': sources,
+        'context': context[:500] + "..." if len(context) > 500 else context
+    }
+    if current_user:
+        metadata['user'] = current_user['name']
+        metadata['authenticated'] = True
+    return metadata
+
+def chat_response(question, current_user=None):
+    """Resposta JSON de /chat e /protected-chat"""
+    prompt, sources, chunk_ids, context = prepare_chat(question, current_user)
+    
+    if prompt is None:
+        response_data = {'answer': context, 'sources': [], 'context': ''}
+        if current_user:
+            response_data['user'] = current_user['name']
+        return jsonify(response_data)
+    
+    # Processamento da resposta através do modelo Groq LLM (ou do cache de respostas)
+    # O prompt identifica o usuário: as respostas em cache são separadas por usuário
+    scope = f"user:{current_user['id']}" if current_user else ''
+    answer, cached = generate_answer(prompt, question, chunk_ids, scope)
+    
+    response_data = {'answer': answer, 'cached': cached}
+    response_data.update(chat_metadata(sources, context, current_user))
+    return jsonify(response_data)
+
+def chat_stream_response(question, current_user=None):
+    """Resposta SSE de /chat/stream e /protected-chat/stream"""
+    prompt, sources, chunk_ids, context = prepare_chat(question, current_user)
+    
+    if prompt is None:
+        metadata = {'sources': [], 'context': ''}
+        if current_user:
+            metadata['user'] = current_user['name']
+        return sse_response(iter([
+            sse_event('sources', metadata),
+            sse_event('token', {'content': context}),
+            sse_event('done', {'cached': False})
+        ]))
+    
+    scope = f"user:{current_user['id']}" if current_user else ''
+    return sse_response(stream_answer(prompt, question, chunk_ids,
+                                      chat_metadata(sources, context, current_user), scope))
+
 @app.route('/chat', methods=['POST'])
 def chat():
     """
@@ -149,71 +681,31 @@ def chat():
         
         logger.info(f"Pergunta recebida: {question}")
         
-        # Verificação de disponibilidade de documentos no sistema
-        if not document_store:
-            return jsonify({
-                'answer': 'Ainda não há documentos carregados no sistema. Por favor, faça upload de documentos da UFMA para começar a fazer perguntas.',
-                'sources': [],
-                'context': ''
-            })
-        
-        # Execução da busca por documentos relevantes à pergunta
-        search_results = simple_search(question, document_store)
-        
-        if not search_results:
-            return jsonify({
-                'answer': 'Não encontrei informações relevantes nos documentos carregados para responder sua pergunta.',
-                'sources': [],
-                'context': ''
-            })
-        
-        # Preparação do contexto agregado para o modelo de linguagem
-        context_parts = []
-        sources = []
+        return chat_response(question)
         
-        for result in search_results:
-            context_parts.append(result['content'])
-            sources.append({
-                'nome do arquivo': result['filename'],
-                'score': result['score'],
-                'conteudo': result['content'][:200] + "..." if len(result['content']) > 200 else result['content']
-            })
-        
-        context = "\n\n".join(context_parts)
-        
-        # Construção do prompt especializado para documentos da UFMA
-        prompt = f"""Você é um assistente especializado em documentos da UFMA (Universidade Federal do Maranhão).
-
-Pergunta: {question}
-
-Contexto dos documentos da UFMA:
-{context}
+    except Exception as e:
+        logger.error(f"Erro no chat: {e}")
+        return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
-Responda de forma clara e precisa baseando-se apenas nas informações fornecidas dos documentos da UFMA:"""
-        
-        # Processamento da resposta através do modelo Groq LLM
-        try:
-            response = client.chat.completions.create(
-                model="llama3-8b-8192",
-                messages=[{"role": "user", "content": prompt}],
-                max_tokens=1000,
-                temperature=0.3
-            )
-            
-            answer = response.choices[0].message.content
-            
-        except Exception as e:
-            logger.error(f"Erro no Groq: {e}")
-            answer = f"Erro ao processar resposta: {str(e)}"
-        
-        return jsonify({
-            'answer': answer,
-            'sources': sources,
-            'context': context[:500] + "..." if len(context) > 500 else context
-        })
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """
+    Variante de /chat com a resposta enviada por Server-Sent Events à medida que o LLM a gera
+    Eventos: 'sources' (fontes e contexto), 'token' (fragmentos da resposta), 'done' ou 'error'
+    """
+    data = request.json or {}
+    question = data.get('question')
+    
+    if not question:
+        return jsonify({'error': 'Pergunta não fornecida'}), 400
+    
+    logger.info(f"Pergunta recebida (stream): {question}")
+    
+    try:
+        return chat_stream_response(question)
         
     except Exception as e:
-        logger.error(f"Erro no chat: {e}")
+        logger.error(f"Erro no chat (stream): {e}")
         return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
 # Endpoint de chat protegido (apenas se autenticação estiver habilitada)
@@ -234,94 +726,67 @@ if AUTH_ENABLED:
             
             logger.info(f"Pergunta de usuário autenticado {current_user['email']}: {question}")
             
-            if not document_store:
-                return jsonify({
-                    'answer': 'Ainda não há documentos carregados no sistema.',
-                    'sources': [],
-                    'context': '',
-                    'user': current_user['name']
-                })
-            
-            search_results = simple_search(question, document_store)
-            
-            if not search_results:
-                return jsonify({
-                    'answer': 'Não encontrei informações relevantes nos documentos carregados.',
-                    'sources': [],
-                    'context': '',
-                    'user': current_user['name']
-                })
-            
-            context_parts = []
-            sources = []
-            
-            for result in search_results:
-                context_parts.append(result['content'])
-                sources.append({
-                    'nome do arquivo': result['filename'],
-                    'score': result['score'],
-                    'conteudo': result['content'][:200] + "..." if len(result['content']) > 200 else result['content']
-                })
-            
-            context = "\n\n".join(context_parts)
-            
-            prompt = f"""Você é um assistente especializado em documentos da UFMA (Universidade Federal do Maranhão).
+            return chat_response(question, current_user)
             
-Usuário autenticado: {current_user['name']} ({current_user['email']})
-Pergunta: {question}
-
-Contexto dos documentos da UFMA:
-{context}
+        except Exception as e:
+            logger.error(f"Erro no chat protegido: {e}")
+            return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
-Responda de forma clara e precisa baseando-se apenas nas informações fornecidas dos documentos da UFMA:"""
-            
-            try:
-                response = client.chat.completions.create(
-                    model="llama3-8b-8192",
-                    messages=[{"role": "user", "content": prompt}],
-                    max_tokens=1000,
-                    temperature=0.3
-                )
-                
-                answer = response.choices[0].message.content
-                
-            except Exception as e:
-                logger.error(f"Erro no Groq: {e}")
-                answer = f"Erro ao processar resposta: {str(e)}"
-            
-            return jsonify({
-                'answer': answer,
-                'sources': sources,
-                'context': context[:500] + "..." if len(context) > 500 else context,
-                'user': current_user['name'],
-                'authenticated': True
-            })
+    @app.route('/protected-chat/stream', methods=['POST'])
+    @token_required
+    def protected_chat_stream(current_user):
+        """Variante de /protected-chat com a resposta enviada por Server-Sent Events (ver /chat/stream)"""
+        data = request.json or {}
+        question = data.get('question')
+        
+        if not question:
+            return jsonify({'error': 'Pergunta não fornecida'}), 400
+        
+        logger.info(f"Pergunta de usuário autenticado {current_user['email']} (stream): {question}")
+        
+        try:
+            return chat_stream_response(question, current_user)
             
         except Exception as e:
-            logger.error(f"Erro no chat protegido: {e}")
+            logger.error(f"Erro no chat protegido (stream): {e}")
             return jsonify({'error': f'Erro interno: {str(e)}'}), 500
 
+def authorize_upload():
+    """
+    Se autenticação estiver habilitada, o upload e o acompanhamento dos jobs requerem admin
+    Retorna (usuário, None) ou (None, resposta de erro)
+    """
+    if not AUTH_ENABLED:
+        return None, None
+    
+    # Verificar se tem header de autorização
+    auth_header = request.headers.get('Authorization')
+    if not auth_header:
+        return None, (jsonify({'error': 'Autenticação necessária para upload'}), 401)
+    
+    try:
+        token = auth_header.split(' ')[1]
+        current_user = auth_manager.get_user_by_token(token)
+    except:
+        return None, (jsonify({'error': 'Token inválido'}), 401)
+    
+    if not current_user or not current_user['is_admin']:
+        return None, (jsonify({'error': 'Acesso negado. Privilégios de administrador necessários'}), 403)
+    
+    return current_user, None
+
 @app.route('/upload', methods=['POST'])
 def upload_document():
     """
-    Sistema de upload e processamento de documentos PDF
+    Sistema de upload de documentos PDF
+    O arquivo é gravado em staging e processado por um job em segundo plano; a resposta traz
+    o id do job, acompanhado em /upload/jobs/<id>. Um PDF com conteúdo já enviado não é
+    processado nem indexado novamente: a resposta é o job existente
     Se autenticação estiver habilitada, requer privilégios de admin
     """
-    # Se autenticação estiver habilitada, verificar se é admin
-    current_user = None
-    if AUTH_ENABLED:
-        # Verificar se tem header de autorização
-        auth_header = request.headers.get('Authorization')
-        if auth_header:
-            try:
-                token = auth_header.split(' ')[1]
-                current_user = auth_manager.get_user_by_token(token)
-                if not current_user or not current_user['is_admin']:
-                    return jsonify({'error': 'Acesso negado. Privilégios de administrador necessários'}), 403
-            except:
-                return jsonify({'error': 'Token inválido'}), 401
-        else:
-            return jsonify({'error': 'Autenticação necessária para upload'}), 401
+    current_user, error_response = authorize_upload()
+    if error_response:
+        return error_response
     
     try:
         if 'file' not in request.files:
@@ -335,66 +800,185 @@ def upload_document():
         if not file.filename.lower().endswith('.pdf'):
             return jsonify({'error': 'Apenas arquivos PDF são aceitos'}), 400
         
-        # Pipeline de processamento de documentos PDF
-        try:
-            from PyPDF2 import PdfReader
-            import io
-            
-            # Leitura e parsing do arquivo PDF
-            pdf_bytes = file.read()
-            pdf_file = io.BytesIO(pdf_bytes)
-            pdf_reader = PdfReader(pdf_file)
-            
-            # Extração de texto de todas as páginas do documento
-            full_text = ""
-            for page in pdf_reader.pages:
-                full_text += page.extract_text() + "\n"
-            
-            if not full_text.strip():
-                return jsonify({'error': 'PDF não contém texto legível'}), 400
-            
-        except Exception as e:
-            return jsonify({'error': f'Erro ao processar PDF: {str(e)}'}), 400
+        # Um arquivo com o nome de um documento existente é uma nova versão dele
+        job_id, created = ingestion_queue.submit(file.stream, file.filename, current_user,
+                                                 replaces=document_store.find_document(file.filename))
+        if job_id is None:
+            return jsonify({'error': 'Erro ao registrar o processamento do upload'}), 500
         
-        # Segmentação do texto em chunks para otimizar busca e processamento
-        chunks = simple_text_splitter(full_text)
+        if not created:
+            job = jobs_db.get_ingestion_job(job_id)
+            job['duplicate'] = True
+            job['message'] = f"O conteúdo de {file.filename} já foi enviado como {job['filename']}"
+            job['total_documents'] = len(document_store)
+            return jsonify(job)
         
-        # Armazenamento dos chunks processados no sistema
-        for chunk in chunks:
-            doc_data = {
-                'content': chunk,
-                'filename': file.filename
-            }
-            # Adicionar informações do usuário se autenticado
-            if current_user:
-                doc_data.update({
-                    'uploaded_by': current_user['email'],
-                    'uploaded_at': str(datetime.now())
-                })
-            
-            document_store.append(doc_data)
-        
-        upload_info = f"PDF {file.filename} processado: {len(chunks)} chunks"
+        upload_info = f"PDF {file.filename} recebido: job {job_id}"
         if current_user:
             upload_info += f" por {current_user['email']}"
         logger.info(upload_info)
         
         response_data = {
-            'message': f'PDF {file.filename} carregado com sucesso!',
+            'message': f'PDF {file.filename} recebido, processamento em andamento',
             'filename': file.filename,
-            'chunks': len(chunks),
-            'total_documents': len(document_store)
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/upload/jobs/{job_id}'
         }
         
         if current_user:
             response_data['uploaded_by'] = current_user['name']
         
-        return jsonify(response_data)
+        return jsonify(response_data), 202
         
     except Exception as e:
         logger.error(f"Erro no upload: {e}")
         return jsonify({'error': f'Erro no upload: {str(e)}'}), 500
 
+def zip_member_error(info):
+    """Motivo da rejeição de um membro do ZIP pelos tamanhos declarados, ou None"""
+    if info.file_size > BULK_UPLOAD_MAX_FILE_BYTES:
+        return f'Arquivo maior que o limite de {BULK_UPLOAD_MAX_FILE_BYTES} bytes'
+    if info.file_size > BULK_UPLOAD_MAX_RATIO * max(info.compress_size, 1):
+        return f'Taxa de compressão acima de {BULK_UPLOAD_MAX_RATIO}:1'
+    return None
+
+@app.route('/upload/bulk', methods=['POST'])
+def bulk_upload_documents():
+    """
+    Upload em lote: vários PDFs (campo files) ou um arquivo ZIP com PDFs
+    O acesso é verificado uma vez para o lote; os arquivos passam pela fila de ingestão e os
+    índices são atualizados a cada INGEST_BATCH_INDEX_EVERY documentos gravados e ao fim do lote.
+    ZIPs cujo conteúdo descompactado passa de BULK_UPLOAD_MAX_TOTAL_BYTES são recusados; arquivos
+    acima de BULK_UPLOAD_MAX_FILE_BYTES ou da taxa BULK_UPLOAD_MAX_RATIO são rejeitados no relatório.
+    Retorna o relatório por arquivo com os ids dos jobs
+    """
+    current_user, error_response = authorize_upload()
+    if error_response:
+        return error_response
+    
+    try:
+        uploads = [upload for upload in request.files.getlist('files') + request.files.getlist('file')
+                   if upload.filename]
+        if not uploads:
+            return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+        
+        # Cada entrada é (nome, função que abre o conteúdo); membros do ZIP são lidos sob demanda
+        if len(uploads) == 1 and uploads[0].filename.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(uploads[0].stream)
+            except zipfile.BadZipFile:
+                return jsonify({'error': 'Arquivo ZIP inválido'}), 400
+            members = [info for info in archive.infolist()
+                       if not info.is_dir() and not info.filename.startswith('__MACOSX/')]
+            # Tamanhos declarados no diretório do ZIP: a leitura de um membro nunca passa do seu file_size
+            total_size = sum(info.file_size for info in members if info.filename.lower().endswith('.pdf'))
+            if total_size > BULK_UPLOAD_MAX_TOTAL_BYTES:
+                return jsonify({'error': f'Conteúdo descompactado do ZIP maior que {BULK_UPLOAD_MAX_TOTAL_BYTES} bytes'}), 400
+            entries = [
+                (info.filename, lambda info=info: archive.open(info), zip_member_error(info))
+                for info in members
+            ]
+        else:
+            entries = [(upload.filename, lambda upload=upload: upload.stream, None) for upload in uploads]
+        
+        if len(entries) > BULK_UPLOAD_MAX_FILES:
+            return jsonify({'error': f'Máximo de {BULK_UPLOAD_MAX_FILES} arquivos por lote'}), 400
+        
+        batch = IngestionBatch(INGEST_BATCH_INDEX_EVERY)
+        report = []
+        
+        for name, open_entry, entry_error in entries:
+            filename = os.path.basename(name)
+            if not filename.lower().endswith('.pdf'):
+                report.append({'filename': name, 'status': 'rejected', 'error': 'Apenas arquivos PDF são aceitos'})
+                continue
+            if entry_error:
+                report.append({'filename': filename, 'status': 'rejected', 'error': entry_error})
+                continue
+            
+            try:
+                job_id, created = ingestion_queue.submit(open_entry(), filename, current_user, batch,
+                                                         replaces=document_store.find_document(filename),
+                                                         max_bytes=BULK_UPLOAD_MAX_FILE_BYTES)
+            except UploadTooLargeError as e:
+                report.append({'filename': filename, 'status': 'rejected', 'error': str(e)})
+                continue
+            except Exception as e:
+                report.append({'filename': filename, 'status': 'rejected', 'error': f'Erro ao ler arquivo: {str(e)}'})
+                continue
+            
+            if job_id is None:
+                report.append({'filename': filename, 'status': 'rejected', 'error': 'Erro ao registrar o processamento do upload'})
+            else:
+                report.append({'filename': filename, 'job_id': job_id, 'status': 'queued' if created else 'duplicate'})
+        
+        ingestion_queue.close_batch(batch)
+        
+        summary = {status: sum(1 for item in report if item['status'] == status)
+                   for status in ('queued', 'duplicate', 'rejected')}
+        logger.info(f"Upload em lote de {len(entries)} arquivos: {summary}")
+        
+        job_ids = [str(item['job_id']) for item in report if 'job_id' in item]
+        
+        return jsonify({
+            'message': f"{summary['queued']} arquivos enfileirados, {summary['duplicate']} duplicados, {summary['rejected']} rejeitados",
+            'files': report,
+            'summary': summary,
+            'status_url': f"/upload/jobs?ids={','.join(job_ids)}"
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Erro no upload em lote: {e}")
+        return jsonify({'error': f'Erro no upload em lote: {str(e)}'}), 500
+
+@app.route('/upload/jobs', methods=['GET'])
+def upload_jobs_status():
+    """Estado e progresso de vários jobs de ingestão (ids separados por vírgula), para uploads em lote"""
+    current_user, error_response = authorize_upload()
+    if error_response:
+        return error_response
+    
+    try:
+        job_ids = [int(job_id) for job_id in request.args.get('ids', '').split(',') if job_id.strip()]
+    except ValueError:
+        return jsonify({'error': 'Ids de jobs inválidos'}), 400
+    
+    if len(job_ids) > BULK_UPLOAD_MAX_FILES:
+        return jsonify({'error': f'Máximo de {BULK_UPLOAD_MAX_FILES} jobs por consulta'}), 400
+    
+    jobs = jobs_db.get_ingestion_jobs(job_ids) if job_ids else []
+    if jobs is None:
+        return jsonify({'error': 'Erro ao obter jobs'}), 500
+    
+    return jsonify({
+        'jobs': jobs,
+        'pending': sum(1 for job in jobs if job['status'] not in ('done', 'failed')),
+        'total': len(jobs)
+    })
+
+@app.route('/upload/jobs/<int:job_id>', methods=['GET'])
+def upload_job_status(job_id):
+    """
+    Estado e progresso (páginas processadas, chunks indexados) de um job de ingestão
+    Um job abandonado por um processo finalizado é dado como falha aqui, para que o cliente não
+    espere indefinidamente por um job que continua 'queued'
+    """
+    current_user, error_response = authorize_upload()
+    if error_response:
+        return error_response
+    
+    jobs_db.recover_ingestion_jobs(ingestion_queue.staging_dir, INGEST_JOB_STALE_SECONDS, job_id)
+    job = jobs_db.get_ingestion_job(job_id)
+    if not job:
+        return jsonify({'error': 'Job não encontrado'}), 404
+    
+    if job['status'] == 'done':
+        job['message'] = f"PDF {job['filename']} carregado com sucesso!"
+        job['total_documents'] = len(document_store)
+    
+    return jsonify(job)
+
 @app.route('/documents', methods=['GET'])
 def list_documents():
     """Endpoint para listagem e monitoramento de documentos carregados no sistema"""
@@ -410,36 +994,46 @@ def list_documents():
                 except:
                     pass  # Continuar sem autenticação
         
-        # Agregação de estatísticas dos documentos únicos
-        filenames = set()
-        for doc in document_store:
-            filenames.add(doc['filename'])
+        # Catálogo de documentos, mantido pelo armazenamento a cada ingestão
+        # Paginado apenas quando page é informado; sem ele a lista é completa (painel administrativo)
+        total = document_store.document_count
+        paginated = 'page' in request.args
+        if paginated:
+            page = max(request.args.get('page', 1, type=int), 1)
+            per_page = max(request.args.get('per_page', 50, type=int), 1)
+            catalog = document_store.catalog((page - 1) * per_page, per_page)
+        else:
+            page, per_page = 1, max(total, 1)
+            catalog = document_store.catalog()
         
         documents = []
-        for filename in filenames:
-            chunks = sum(1 for doc in document_store if doc['filename'] == filename)
-            
+        for document in catalog:
             doc_info = {
-                'filename': filename,
-                'chunks': chunks,
+                'document_id': document.doc_id,
+                'filename': document.filename,
+                'chunks': document.chunk_count,
                 'status': 'processed'
             }
             
             # Adicionar informações de upload se disponível
-            for doc in document_store:
-                if doc['filename'] == filename:
-                    if 'uploaded_by' in doc:
-                        doc_info['uploaded_by'] = doc['uploaded_by']
-                    if 'uploaded_at' in doc:
-                        doc_info['upload_date'] = doc['uploaded_at']
-                    break
+            if document.uploaded_by is not None:
+                doc_info['uploaded_by'] = document.uploaded_by
+            if document.uploaded_at is not None:
+                doc_info['upload_date'] = document.uploaded_at
+            if document.file_size is not None:
+                doc_info['file_size'] = document.file_size
+            if document.file_hash is not None:
+                doc_info['file_hash'] = document.file_hash
             
             documents.append(doc_info)
         
         response_data = {
             'documents': documents,
-            'total': len(documents),
-            'total_chunks': len(document_store)
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'total_pages': (total + per_page - 1) // per_page,
+            'total_chunks': document_store.live_count
         }
         
         if current_user:
@@ -450,6 +1044,97 @@ def list_documents():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/documents/<int:doc_id>', methods=['DELETE'])
+def delete_document(doc_id):
+    """
+    Remove um documento pelo id: seus chunks recebem tombstones nos índices na hora (deixam de
+    ser pontuados) e as listas de ocorrências são compactadas em segundo plano
+    Se autenticação estiver habilitada, requer privilégios de admin
+    """
+    current_user, error_response = authorize_upload()
+    if error_response:
+        return error_response
+    
+    try:
+        document_store.refresh()
+        if doc_id >= len(document_store.documents) or document_store.is_document_deleted(doc_id):
+            return jsonify({'error': 'Documento não encontrado'}), 404
+        
+        filename = document_store.documents[doc_id].filename
+        chunk_count = document_store.documents[doc_id].chunk_count
+        if not remove_document(doc_id):
+            return jsonify({'error': 'Documento não encontrado'}), 404
+        
+        sync_indexes()
+        
+        removal_info = f"Documento {doc_id} ({filename}) removido: {chunk_count} chunks"
+        if current_user:
+            removal_info += f" por {current_user['email']}"
+        logger.info(removal_info)
+        
+        return jsonify({
+            'message': f'Documento {filename} removido com sucesso!',
+            'document_id': doc_id,
+            'filename': filename,
+            'chunks_removed': chunk_count
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro ao remover documento: {e}")
+        return jsonify({'error': f'Erro ao remover documento: {str(e)}'}), 500
+
+@app.route('/documents/<int:doc_id>', methods=['PUT'])
+def replace_document(doc_id):
+    """
+    Substitui um documento por uma nova versão do PDF
+    O novo arquivo passa pela fila de ingestão; o documento anterior só é removido quando a nova
+    versão estiver gravada, e apenas os chunks dos dois documentos são processados
+    """
+    current_user, error_response = authorize_upload()
+    if error_response:
+        return error_response
+    
+    try:
+        document_store.refresh()
+        if doc_id >= len(document_store.documents) or document_store.is_document_deleted(doc_id):
+            return jsonify({'error': 'Documento não encontrado'}), 404
+        
+        if 'file' not in request.files:
+            return jsonify({'error': 'Nenhum arquivo enviado'}), 400
+        
+        file = request.files['file']
+        
+        if file.filename == '':
+            return jsonify({'error': 'Nenhum arquivo selecionado'}), 400
+        
+        if not file.filename.lower().endswith('.pdf'):
+            return jsonify({'error': 'Apenas arquivos PDF são aceitos'}), 400
+        
+        job_id, created = ingestion_queue.submit(file.stream, file.filename, current_user, replaces=doc_id)
+        if job_id is None:
+            return jsonify({'error': 'Erro ao registrar o processamento do upload'}), 500
+        
+        if not created:
+            job = jobs_db.get_ingestion_job(job_id)
+            job['duplicate'] = True
+            job['message'] = f"O conteúdo de {file.filename} já foi enviado como {job['filename']}; nada foi substituído"
+            return jsonify(job)
+        
+        logger.info(f"Substituição do documento {doc_id} por {file.filename}: job {job_id}")
+        
+        return jsonify({
+            'message': f'PDF {file.filename} recebido, substituição em andamento',
+            'filename': file.filename,
+            'job_id': job_id,
+            'replaces': doc_id,
+            'status': 'queued',
+            'status_url': f'/upload/jobs/{job_id}'
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Erro na substituição: {e}")
+        return jsonify({'error': f'Erro na substituição: {str(e)}'}), 500
+
 # Endpoints administrativos (apenas se autenticação estiver habilitada)
 if AUTH_ENABLED:
     @app.route('/admin/users', methods=['GET'])
@@ -501,10 +1186,14 @@ if AUTH_ENABLED:
             if not stats:
                 return jsonify({'error': 'Erro ao obter estatísticas'}), 500
             
+            if answer_cache is not None:
+                stats['answer_cache'] = answer_cache.stats()
+            
             # Adicionar informações do document store
             stats['document_store'] = {
-                'total_chunks': len(document_store),
-                'unique_documents': len(set(doc['filename'] for doc in document_store))
+                'total_chunks': document_store.live_count,
+                'total_documents': document_store.document_count,
+                'unique_documents': len(set(document.filename for document in document_store.catalog()))
             }
             
             return jsonify({
@@ -0,0 +1,561 @@
+# chunk_store.py - Armazenamento persistente de chunks em disco, carregado via mmap
+import os
+import sys
+import json
+import mmap
+import shutil
+import struct
+import tempfile
+import threading
+import logging
+from array import array
+from collections import deque
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Trava entre processos (workers do gunicorn); indisponível no Windows, onde há um único processo
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_VERSION = struct.Struct('<Q')
+
+# Cada chunk ocupa 3 inteiros de 64 bits no chunks.idx: (doc_id, início, fim) em bytes do texts.dat
+_CHUNK_FIELDS = 3
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+class DocumentInfo:
+    """Metadados de um documento: gravados uma única vez, compartilhados por todos os seus chunks"""
+    __slots__ = ('doc_id', 'filename', 'uploaded_by', 'uploaded_at', 'offset', 'length',
+                 'chunk_count', 'file_size', 'file_hash')
+
+    def __init__(self, doc_id, filename, uploaded_by=None, uploaded_at=None, offset=0, length=0,
+                 chunk_count=None, file_size=None, file_hash=None):
+        self.doc_id = doc_id
+        self.filename = _intern(filename)
+        self.uploaded_by = _intern(uploaded_by)
+        self.uploaded_at = uploaded_at
+        self.offset = offset
+        self.length = length
+        # Registros gravados antes do catálogo não têm chunk_count: calculado na carga
+        self.chunk_count = chunk_count
+        self.file_size = file_size
+        self.file_hash = file_hash
+
+    def to_record(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+class Chunk:
+    """
+    Referência leve a um trecho do texto de um documento
+    O conteúdo só é decodificado do mmap quando acessado; aceita acesso estilo dict
+    (chunk['content'], chunk['filename'], 'uploaded_by' in chunk) para compatibilidade
+    """
+    __slots__ = ('chunk_id', 'doc_id', 'start', 'end', '_store')
+
+    _METADATA_KEYS = ('filename', 'uploaded_by', 'uploaded_at')
+
+    def __init__(self, store, chunk_id, doc_id, start, end):
+        self._store = store
+        self.chunk_id = chunk_id
+        self.doc_id = doc_id
+        self.start = start
+        self.end = end
+
+    @property
+    def document(self):
+        return self._store.documents[self.doc_id]
+
+    @property
+    def content(self):
+        return self._store.read_text(self.start, self.end)
+
+    @property
+    def filename(self):
+        return self.document.filename
+
+    @property
+    def token_count(self):
+        return self._store.token_count(self.chunk_id)
+
+    def __getitem__(self, key):
+        if key == 'content':
+            return self.content
+        if key in self._METADATA_KEYS:
+            value = getattr(self.document, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+            return True
+        except KeyError:
+            return False
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+class ChunkStore:
+    """
+    Armazenamento append-only e compacto dos documentos processados
+    - texts.dat: texto completo de cada documento, gravado uma única vez (sem duplicar a sobreposição)
+    - documents.jsonl: metadados de cada documento (nome, autor do upload, data, posição no texts.dat)
+    - chunks.idx: colunas (doc_id, início, fim) de cada chunk, em bytes do texts.dat
+    - tombstones.idx: ids dos documentos removidos, na ordem da remoção
+    - tokens.idx: quantidade de tokens de cada chunk (0 quando desconhecida: divisores sem contagem
+      ou chunks gravados antes dela)
+    O catálogo dos documentos não removidos (com quantidade de chunks, autor, data, tamanho e hash
+    do arquivo) é mantido em memória à medida que os registros são carregados.
+    O texto é mapeado em memória e os chunks são fatiados sob demanda; a inicialização lê apenas
+    os metadados dos documentos e as colunas de offsets, nunca o corpus.
+    Comporta-se como uma lista somente-leitura de Chunk; ids de chunks removidos continuam válidos
+    (os índices de busca dependem deles), mas is_deleted() os identifica.
+
+    Vários processos podem abrir o mesmo diretório: as gravações são serializadas por uma trava
+    de arquivo e incrementam um contador de versão mapeado em memória; cada processo chama
+    refresh() antes das consultas para carregar apenas os registros acrescentados pelos outros.
+    """
+
+    def __init__(self, data_dir='data'):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+        self.text_path = os.path.join(data_dir, 'texts.dat')
+        self.documents_path = os.path.join(data_dir, 'documents.jsonl')
+        self.index_path = os.path.join(data_dir, 'chunks.idx')
+        self.tombstones_path = os.path.join(data_dir, 'tombstones.idx')
+        self.tokens_path = os.path.join(data_dir, 'tokens.idx')
+        self.version_path = os.path.join(data_dir, 'version')
+        self.lock_path = os.path.join(data_dir, 'store.lock')
+        self._lock = threading.RLock()
+        # Trava própria do mmap do texto: leituras não esperam por gravações nem por refresh()
+        self._map_lock = threading.Lock()
+        self._text_map = None
+
+        for path in (self.text_path, self.documents_path, self.index_path, self.tombstones_path, self.tokens_path,
+                     self.lock_path):
+            if not os.path.exists(path):
+                open(path, 'wb').close()
+        with self._exclusive():
+            if not os.path.exists(self.version_path) or os.path.getsize(self.version_path) < _VERSION.size:
+                with open(self.version_path, 'wb') as version_file:
+                    version_file.write(_VERSION.pack(0))
+        with open(self.version_path, 'r+b') as version_file:
+            self._version_map = mmap.mmap(version_file.fileno(), _VERSION.size)
+
+        self.documents = []
+        # Catálogo: doc_id → DocumentInfo dos documentos não removidos, na ordem de gravação
+        self._catalog = {}
+        # Colunas intercaladas (doc_id, início, fim) de cada chunk
+        self._columns = array('Q')
+        self._token_counts = array('I')
+        # Documentos removidos, na ordem da remoção, e total de chunks que eles tinham
+        self.deleted_documents = []
+        self._deleted_set = set()
+        self.deleted_chunks = 0
+        # Bytes já carregados de cada arquivo; refresh() lê apenas o que vem depois
+        self._documents_loaded = 0
+        self._index_loaded = 0
+        self._tombstones_loaded = 0
+        self._tokens_loaded = 0
+
+        self._version = self.version
+        self._load_new_records()
+        logger.info(f"Chunk store carregado de {data_dir}: {len(self.documents)} documentos, {len(self)} chunks")
+
+    @property
+    def version(self):
+        """Versão global do armazenamento, incrementada a cada gravação de qualquer processo"""
+        return _VERSION.unpack_from(self._version_map, 0)[0]
+
+    @contextmanager
+    def _exclusive(self):
+        """Trava de escrita entre threads e entre processos"""
+        with self._lock:
+            with open(self.lock_path, 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_new_records(self):
+        """Carrega os registros completos gravados após a última leitura"""
+        with self._lock:
+            # Remoções primeiro: todo documento removido já está completo em disco e será lido abaixo
+            with open(self.tombstones_path, 'rb') as tombstones_file:
+                tombstones_file.seek(self._tombstones_loaded)
+                raw = tombstones_file.read()
+            tombstones = array('Q')
+            complete = len(raw) - len(raw) % tombstones.itemsize
+            tombstones.frombytes(raw[:complete])
+            self._tombstones_loaded += complete
+
+            # Chunks antes dos documentos: todo chunk lido já tem seu documento gravado em disco
+            record_size = self._columns.itemsize * _CHUNK_FIELDS
+            with open(self.index_path, 'rb') as index_file:
+                index_file.seek(self._index_loaded)
+                raw = index_file.read()
+            complete = len(raw) - len(raw) % record_size
+            self._columns.frombytes(raw[:complete])
+            self._index_loaded += complete
+
+            # Contagens de tokens são gravadas antes dos chunks: lidas apenas até o último chunk carregado
+            missing = len(self) - len(self._token_counts)
+            if missing > 0:
+                with open(self.tokens_path, 'rb') as tokens_file:
+                    tokens_file.seek(self._tokens_loaded)
+                    raw = tokens_file.read(missing * self._token_counts.itemsize)
+                complete = len(raw) - len(raw) % self._token_counts.itemsize
+                self._token_counts.frombytes(raw[:complete])
+                self._tokens_loaded += complete
+
+            with open(self.documents_path, 'rb') as documents_file:
+                documents_file.seek(self._documents_loaded)
+                raw = documents_file.read()
+            complete = raw.rfind(b'\n') + 1
+            for line in raw[:complete].splitlines():
+                if line.strip():
+                    document = DocumentInfo(**json.loads(line))
+                    if document.chunk_count is None:
+                        document.chunk_count = len(self.chunk_range(document.doc_id))
+                    self.documents.append(document)
+                    self._catalog[document.doc_id] = document
+            self._documents_loaded += complete
+
+            for doc_id in tombstones:
+                if doc_id not in self._deleted_set:
+                    self._deleted_set.add(doc_id)
+                    self.deleted_documents.append(doc_id)
+                    self.deleted_chunks += self.documents[doc_id].chunk_count
+                    self._catalog.pop(doc_id, None)
+
+    def _truncate_partial_records(self):
+        """Remove restos de uma gravação interrompida (chamado com a trava de escrita)"""
+        for path, loaded in ((self.index_path, self._index_loaded), (self.documents_path, self._documents_loaded),
+                             (self.tombstones_path, self._tombstones_loaded),
+                             (self.tokens_path, self._tokens_loaded)):
+            if os.path.getsize(path) > loaded:
+                with open(path, 'r+b') as partial_file:
+                    partial_file.truncate(loaded)
+
+    def refresh(self):
+        """
+        Incorpora as gravações feitas por outros processos desde a última verificação
+        Custa a leitura de 8 bytes quando nada mudou; retorna True se houve mudança
+        """
+        current = self.version
+        if current == self._version:
+            return False
+        with self._lock:
+            self._load_new_records()
+            self._version = current
+        return True
+
+    def _remap(self):
+        """(Re)mapeia o texts.dat em memória após crescer (chamado com a trava do mmap)"""
+        if self._text_map is not None:
+            self._text_map.close()
+        self._text_map = None
+        if os.path.getsize(self.text_path):
+            with open(self.text_path, 'rb') as text_file:
+                self._text_map = mmap.mmap(text_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read_text(self, start, end):
+        """Decodifica um trecho do texts.dat diretamente do mmap"""
+        with self._map_lock:
+            if self._text_map is None or end > len(self._text_map):
+                self._remap()
+            with memoryview(self._text_map) as view:
+                return str(view[start:end], 'utf-8')
+
+    def __len__(self):
+        return len(self._columns) // _CHUNK_FIELDS
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, chunk_id):
+        if chunk_id < 0:
+            chunk_id += len(self)
+        if not 0 <= chunk_id < len(self):
+            raise IndexError('chunk_id fora do intervalo')
+        base = chunk_id * _CHUNK_FIELDS
+        columns = self._columns
+        return Chunk(self, chunk_id, columns[base], columns[base + 1], columns[base + 2])
+
+    def __iter__(self):
+        for chunk_id in range(len(self)):
+            yield self[chunk_id]
+
+    @property
+    def live_count(self):
+        """Quantidade de chunks de documentos não removidos"""
+        return len(self) - self.deleted_chunks
+
+    def live_chunks(self):
+        """Chunks dos documentos não removidos"""
+        for chunk in self:
+            if chunk.doc_id not in self._deleted_set:
+                yield chunk
+
+    def token_count(self, chunk_id):
+        """Quantidade de tokens do chunk registrada na ingestão, ou None se desconhecida"""
+        if chunk_id < len(self._token_counts):
+            return self._token_counts[chunk_id] or None
+        return None
+
+    def is_deleted(self, chunk_id):
+        return self._columns[chunk_id * _CHUNK_FIELDS] in self._deleted_set
+
+    def is_document_deleted(self, doc_id):
+        return doc_id in self._deleted_set
+
+    @property
+    def document_count(self):
+        """Quantidade de documentos não removidos"""
+        return len(self._catalog)
+
+    def catalog(self, offset=0, limit=None):
+        """Documentos não removidos, do mais recente ao mais antigo, a partir de offset"""
+        with self._lock:
+            documents = list(reversed(self._catalog.values()))
+        end = None if limit is None else offset + limit
+        return documents[offset:end]
+
+    def find_document(self, filename):
+        """Documento não removido mais recente com o nome de arquivo informado, ou None"""
+        for document in reversed(self.documents):
+            if document.filename == filename and document.doc_id not in self._deleted_set:
+                return document.doc_id
+        return None
+
+    def document_text(self, doc_id):
+        document = self.documents[doc_id]
+        return self.read_text(document.offset, document.offset + document.length)
+
+    def chunk_spans(self, doc_id):
+        """
+        Intervalos (início, fim, tokens) de cada chunk do documento, em caracteres do texto do documento
+        (tokens 0 quando a contagem é desconhecida)
+        """
+        document = self.documents[doc_id]
+        columns = self._columns
+        byte_spans = [(columns[chunk_id * _CHUNK_FIELDS + 1] - document.offset,
+                       columns[chunk_id * _CHUNK_FIELDS + 2] - document.offset)
+                      for chunk_id in self.chunk_range(doc_id)]
+
+        # Converte os offsets em bytes percorrendo o texto uma única vez, em ordem crescente
+        raw = self.document_text(doc_id).encode('utf-8')
+        chars = {}
+        position = previous = 0
+        for offset in sorted({offset for span in byte_spans for offset in span}):
+            position += len(raw[previous:offset].decode('utf-8'))
+            chars[offset] = position
+            previous = offset
+        return [(chars[start], chars[end], self._token_counts[chunk_id] if chunk_id < len(self._token_counts) else 0)
+                for chunk_id, (start, end) in zip(self.chunk_range(doc_id), byte_spans)]
+
+    def chunk_range(self, doc_id):
+        """
+        Ids dos chunks de um documento: são contíguos e os doc_ids crescem com os chunk_ids,
+        então o intervalo é localizado por busca binária nas colunas
+        """
+        columns = self._columns
+
+        def first_chunk_at_least(target):
+            low, high = 0, len(self)
+            while low < high:
+                middle = (low + high) // 2
+                if columns[middle * _CHUNK_FIELDS] < target:
+                    low = middle + 1
+                else:
+                    high = middle
+            return low
+
+        return range(first_chunk_at_least(doc_id), first_chunk_at_least(doc_id + 1))
+
+    def open_document(self, filename, uploaded_by=None, uploaded_at=None, file_size=None, file_hash=None):
+        """Inicia a gravação em partes de um novo documento (ver DocumentWriter)"""
+        return DocumentWriter(self, filename, uploaded_by, uploaded_at, file_size, file_hash)
+
+    def add_document(self, text, spans, filename, uploaded_by=None, uploaded_at=None, file_size=None,
+                     file_hash=None):
+        """
+        Grava o texto de um documento uma única vez e registra seus chunks como intervalos
+        spans: (início, fim[, tokens]) em caracteres do texto, como produzidos pelo divisor de texto
+        Retorna (doc_id, id do primeiro chunk)
+        """
+        with self.open_document(filename, uploaded_by, uploaded_at, file_size, file_hash) as writer:
+            writer.write(text)
+            for span in spans:
+                writer.add_chunk(*span)
+            return writer.commit()
+
+    def delete_document(self, doc_id):
+        """
+        Remove um documento registrando uma marca (tombstone); o texto permanece no texts.dat
+        e os ids dos chunks não mudam. Retorna False se o documento não existe ou já foi removido
+        """
+        with self._exclusive():
+            self._load_new_records()
+            self._truncate_partial_records()
+            if not 0 <= doc_id < len(self.documents) or doc_id in self._deleted_set:
+                return False
+
+            with open(self.tombstones_path, 'ab') as tombstones_file:
+                tombstones_file.write(array('Q', (doc_id,)).tobytes())
+                tombstones_file.flush()
+                os.fsync(tombstones_file.fileno())
+
+            self._load_new_records()
+            self._publish()
+            return True
+
+    def _publish(self):
+        """Incrementa a versão global para que os demais processos vejam a gravação"""
+        self._version = self.version + 1
+        _VERSION.pack_into(self._version_map, 0, self._version)
+        self._version_map.flush()
+
+class DocumentWriter:
+    """
+    Gravação incremental de um documento: o texto é acrescentado a um arquivo temporário privado
+    à medida que chega e os chunks são registrados por posição, sem manter o documento inteiro em
+    memória. Apenas a janela de texto ainda referenciável por chunks futuros fica retida (ver release()).
+    A trava de escrita do armazenamento só é tomada em commit(), que copia o texto para o texts.dat;
+    leituras e outras gravações não esperam pela extração. Usado como context manager, descarta a
+    gravação se ocorrer uma exceção antes do commit.
+    """
+
+    def __init__(self, store, filename, uploaded_by=None, uploaded_at=None, file_size=None, file_hash=None):
+        self._store = store
+        self._spool = tempfile.TemporaryFile(dir=store.data_dir)
+        # doc_id e offset só são conhecidos no commit: até lá as posições são relativas ao documento
+        self.document = DocumentInfo(None, filename, uploaded_by, uploaded_at, 0, 0,
+                                     file_size=file_size, file_hash=file_hash)
+        self._columns = array('Q')
+        self._token_counts = array('I')
+        self._chars = 0
+        # Trechos retidos: (posição em caracteres, posição em bytes, texto)
+        self._segments = deque()
+        self._finished = False
+
+    @property
+    def chunk_count(self):
+        return len(self._columns) // _CHUNK_FIELDS
+
+    def write(self, text):
+        """Acrescenta texto ao documento"""
+        encoded = text.encode('utf-8')
+        self._spool.write(encoded)
+        self._segments.append((self._chars, self.document.length, text))
+        self._chars += len(text)
+        self.document.length += len(encoded)
+
+    def _byte_offset(self, position):
+        """Converte uma posição em caracteres (dentro da janela retida) em bytes do documento"""
+        if position == self._chars:
+            return self.document.length
+        for char_start, byte_start, text in self._segments:
+            if char_start <= position < char_start + len(text):
+                prefix = text[:position - char_start].encode('utf-8')
+                return byte_start + len(prefix)
+        raise ValueError(f'posição {position} fora da janela de texto retida')
+
+    def add_chunk(self, start, end, token_count=0):
+        """Registra um chunk pelo intervalo (início, fim) em caracteres do documento e seus tokens, se contados"""
+        self._columns.extend((0, self._byte_offset(start), self._byte_offset(end)))
+        self._token_counts.append(token_count)
+
+    def release(self, position):
+        """Libera os trechos de texto anteriores a `position`, que nenhum chunk futuro referencia"""
+        while self._segments:
+            char_start, _, text = self._segments[0]
+            if char_start + len(text) > position:
+                break
+            self._segments.popleft()
+
+    def commit(self):
+        """Torna o documento e seus chunks visíveis; retorna (doc_id, id do primeiro chunk)"""
+        store = self._store
+        try:
+            self._spool.flush()
+            self._spool.seek(0)
+            with store._exclusive():
+                # Outro processo pode ter gravado desde a última leitura: o doc_id depende do estado atual
+                store._load_new_records()
+                store._truncate_partial_records()
+                self.document.doc_id = len(store.documents)
+
+                with open(store.text_path, 'ab') as text_file:
+                    self.document.offset = text_file.tell()
+                    try:
+                        shutil.copyfileobj(self._spool, text_file)
+                        text_file.flush()
+                        os.fsync(text_file.fileno())
+                    except Exception:
+                        text_file.truncate(self.document.offset)
+                        raise
+
+                # Posições relativas ao documento → (doc_id, bytes do texts.dat)
+                columns = self._columns
+                for base in range(0, len(columns), _CHUNK_FIELDS):
+                    columns[base] = self.document.doc_id
+                    columns[base + 1] += self.document.offset
+                    columns[base + 2] += self.document.offset
+
+                self.document.chunk_count = self.chunk_count
+                with open(store.documents_path, 'a', encoding='utf-8') as documents_file:
+                    documents_file.write(json.dumps(self.document.to_record(), ensure_ascii=False) + '\n')
+                    documents_file.flush()
+                    os.fsync(documents_file.fileno())
+
+                # Contagens alinhadas aos ids dos chunks: chunks anteriores sem contagem recebem 0
+                with open(store.tokens_path, 'ab') as tokens_file:
+                    missing = len(store) - len(store._token_counts)
+                    if missing > 0:
+                        tokens_file.write(array('I', bytes(missing * self._token_counts.itemsize)).tobytes())
+                    tokens_file.write(self._token_counts.tobytes())
+                    tokens_file.flush()
+                    os.fsync(tokens_file.fileno())
+
+                # Os chunks são gravados por último: só existem quando texto e documento já estão em disco
+                with open(store.index_path, 'ab') as index_file:
+                    index_file.write(columns.tobytes())
+                    index_file.flush()
+                    os.fsync(index_file.fileno())
+
+                first_chunk_id = len(store)
+                store._load_new_records()
+                store._publish()
+                return self.document.doc_id, first_chunk_id
+        finally:
+            self._close()
+
+    def _close(self):
+        self._finished = True
+        self._segments.clear()
+        self._spool.close()
+
+    def abort(self):
+        """Descarta o texto gravado no arquivo temporário"""
+        if not self._finished:
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.abort()
+        return False
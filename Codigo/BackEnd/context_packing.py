@@ -0,0 +1,94 @@
+# context_packing.py - Montagem do contexto enviado ao LLM dentro de um orçamento de tokens
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ContextPacker:
+    """
+    Converte os chunks recuperados em trechos de contexto:
+    - chunks do mesmo documento que se sobrepõem ou são vizinhos viram um único trecho, lido uma
+      vez do armazenamento (a sobreposição entre chunks não é repetida)
+    - trechos com texto idêntico (ex.: versões de um documento) entram uma única vez
+    - os trechos são incluídos por score decrescente enquanto couberem em token_budget; um trecho
+      fundido que não cabe é substituído pelo seu melhor chunk
+    """
+
+    def __init__(self, store, counter, token_budget=1024, separator='\n\n'):
+        self.store = store
+        self.counter = counter
+        self.token_budget = token_budget
+        self.separator = separator
+
+    def _merge(self, results):
+        """Agrupa os resultados em trechos contíguos por documento: [(score, [resultados])]"""
+        by_document = {}
+        for result in results:
+            chunk = self.store[result['chunk_id']]
+            by_document.setdefault(chunk.doc_id, []).append((chunk, result))
+
+        groups = []
+        for members in by_document.values():
+            members.sort(key=lambda member: member[0].start)
+            current = [members[0]]
+            for chunk, result in members[1:]:
+                previous = current[-1][0]
+                if chunk.start <= max(member[0].end for member in current) or chunk.chunk_id == previous.chunk_id + 1:
+                    current.append((chunk, result))
+                else:
+                    groups.append(current)
+                    current = [(chunk, result)]
+            groups.append(current)
+
+        return sorted(((max(result['score'] for _, result in group), group) for group in groups),
+                      key=lambda item: -item[0])
+
+    def pack(self, results):
+        """
+        results: resultados da busca (com chunk_id, filename e score) em ordem de relevância
+        Retorna os trechos [{'filename', 'content', 'score', 'tokens', 'chunk_ids'}] por score decrescente
+        """
+        separator_tokens = self.counter.count(self.separator)
+        remaining = self.token_budget
+        passages = []
+        seen = set()
+
+        for score, group in self._merge(results):
+            # Se o trecho fundido não couber, tenta apenas o chunk de maior score do grupo
+            options = [group]
+            if len(group) > 1:
+                options.append([max(group, key=lambda member: member[1]['score'])])
+
+            for members in options:
+                start = members[0][0].start
+                end = max(chunk.end for chunk, _ in members)
+                content = self.store.read_text(start, end).strip()
+                key = ' '.join(content.split())
+                if not content or key in seen:
+                    break
+
+                tokens = self.counter.count(content) + (separator_tokens if passages else 0)
+                if tokens > remaining and not passages and members is options[-1]:
+                    # Nem o trecho mais relevante cabe: vai truncado ao orçamento
+                    while content and tokens > remaining:
+                        content = content[:len(content) * remaining // tokens]
+                        tokens = self.counter.count(content)
+                if tokens > remaining:
+                    continue
+
+                seen.add(key)
+                remaining -= tokens
+                passages.append({
+                    'filename': members[0][1]['filename'],
+                    'content': content,
+                    'score': score,
+                    'tokens': tokens,
+                    'chunk_ids': [chunk.chunk_id for chunk, _ in members]
+                })
+                break
+
+        logger.debug(f"Contexto: {len(results)} chunks → {len(passages)} trechos, "
+                     f"{self.token_budget - remaining} de {self.token_budget} tokens")
+        return passages
+
+    def context(self, passages):
+        return self.separator.join(passage['content'] for passage in passages)
@@ -85,6 +85,29 @@ class DatabaseManager:
                 )
             ''')
             
+            # Colunas do processamento assíncrono dos uploads (bancos criados antes delas são migrados)
+            cursor.execute('PRAGMA table_info(documents)')
+            existing_columns = {row[1] for row in cursor.fetchall()}
+            for column, definition in (
+                ('status', "TEXT DEFAULT 'done'"),
+                ('pages_processed', 'INTEGER DEFAULT 0'),
+                ('error_message', 'TEXT'),
+                ('store_doc_id', 'INTEGER'),
+                ('updated_at', 'TIMESTAMP'),
+                ('owner', 'TEXT'),
+                ('heartbeat_at', 'TIMESTAMP')
+            ):
+                if column not in existing_columns:
+                    cursor.execute(f'ALTER TABLE documents ADD COLUMN {column} {definition}')
+            
+            # Um mesmo conteúdo (hash) só pode ter um documento processado ou em processamento;
+            # documentos removidos liberam o hash (o índice anterior considerava apenas falhas)
+            cursor.execute('DROP INDEX IF EXISTS idx_documents_file_hash')
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_documents_active_file_hash
+                ON documents (file_hash) WHERE status NOT IN ('failed', 'deleted')
+            ''')
+            
             conn.commit()
             conn.close()
             logger.info("Tabelas do banco de dados criadas/verificadas com sucesso")
@@ -172,6 +195,250 @@ class DatabaseManager:
             logger.error(f"Erro na limpeza de sessões: {e}")
             return 0
     
+    def create_ingestion_job(self, filename, original_filename, file_size, file_hash, uploaded_by,
+                             owner=None, staging_dir=None, stale_seconds=None):
+        """
+        Registra um upload na fila de processamento, pertencente ao processo owner
+        Retorna (id do job, True) ou, se o mesmo conteúdo já foi processado ou está em
+        processamento, (id do job existente, False); (None, False) em caso de erro
+        Um job existente interrompido (ver recover_ingestion_jobs) não conta como duplicata
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            # O documento só fica ativo quando o processamento termina; o índice único sobre
+            # file_hash rejeita a inserção se outro processo registrou o mesmo conteúdo
+            for attempt in range(2):
+                try:
+                    cursor.execute('''
+                        INSERT INTO documents (filename, original_filename, file_size, file_hash, uploaded_by,
+                                               is_active, status, updated_at, owner, heartbeat_at)
+                        VALUES (?, ?, ?, ?, ?, FALSE, 'queued', CURRENT_TIMESTAMP, ?, CURRENT_TIMESTAMP)
+                    ''', (filename, original_filename, file_size, file_hash, uploaded_by, owner))
+                    job_id, created = cursor.lastrowid, True
+                    break
+                except sqlite3.IntegrityError:
+                    cursor.execute('''
+                        SELECT id FROM documents WHERE file_hash = ? AND status NOT IN ('failed', 'deleted')
+                    ''', (file_hash,))
+                    job_id, created = cursor.fetchone()[0], False
+                    if attempt or not self._recover_jobs(cursor, staging_dir, stale_seconds, job_id):
+                        break
+            
+            conn.commit()
+            conn.close()
+            
+            return job_id, created
+            
+        except Exception as e:
+            logger.error(f"Erro ao registrar job de ingestão: {e}")
+            return None, False
+    
+    def _recover_jobs(self, cursor, staging_dir, stale_seconds, job_id=None):
+        """
+        Encerra jobs em andamento que nenhum processo vai concluir; retorna quantos liberaram o hash
+        O processo dono renova heartbeat_at dos seus jobs (ver heartbeat_ingestion_jobs) enquanto eles
+        esperam na fila ou são processados; um job sem renovação há stale_seconds foi abandonado
+        - queued/processing sem o arquivo em staging, ou abandonados: failed
+        - indexing abandonados: o documento já está gravado, então done
+        """
+        job_filter = 'AND id = ?' if job_id is not None else ''
+        job_params = [job_id] if job_id is not None else []
+        stale = f'-{int(stale_seconds)} seconds' if stale_seconds else None
+        
+        cursor.execute(f'''
+            SELECT id, filename, COALESCE(heartbeat_at, updated_at) < datetime('now', ?) FROM documents
+            WHERE status IN ('queued', 'processing') {job_filter}
+        ''', [stale] + job_params)
+        interrupted = [
+            row_id for row_id, staged, is_stale in cursor.fetchall()
+            if is_stale or (staging_dir and not os.path.exists(os.path.join(staging_dir, staged)))
+        ]
+        for row_id in interrupted:
+            cursor.execute('''
+                UPDATE documents SET status = 'failed', error_message = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status IN ('queued', 'processing')
+            ''', ('Processamento interrompido; envie o arquivo novamente', row_id))
+        
+        if stale:
+            cursor.execute(f'''
+                UPDATE documents SET status = 'done', is_active = TRUE, updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'indexing' AND COALESCE(heartbeat_at, updated_at) < datetime('now', ?) {job_filter}
+            ''', [stale] + job_params)
+        
+        if interrupted:
+            logger.warning(f"Jobs de ingestão interrompidos marcados como falha: {interrupted}")
+        return len(interrupted)
+    
+    def recover_ingestion_jobs(self, staging_dir, stale_seconds=None, job_id=None):
+        """
+        Encerra os jobs deixados em andamento por um processo finalizado (reinício, deploy, worker
+        derrubado): os jobs rodam em threads do processo e o arquivo em staging é apagado ao fim
+        Chamado na inicialização da fila de ingestão e, para um job (job_id), ao consultar seu estado
+        """
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            recovered = self._recover_jobs(cursor, staging_dir, stale_seconds, job_id)
+            conn.commit()
+            conn.close()
+            return recovered
+        
+        except Exception as e:
+            logger.error(f"Erro ao recuperar jobs de ingestão: {e}")
+            return 0
+    
+    def heartbeat_ingestion_jobs(self, owner):
+        """Renova heartbeat_at dos jobs em andamento do processo owner: nenhum deles foi abandonado"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE documents SET heartbeat_at = CURRENT_TIMESTAMP
+                WHERE owner = ? AND status IN ('queued', 'processing', 'indexing')
+            ''', (owner,))
+            renewed = cursor.rowcount
+            
+            conn.commit()
+            conn.close()
+            
+            return renewed
+            
+        except Exception as e:
+            logger.error(f"Erro ao renovar jobs de ingestão: {e}")
+            return 0
+    
+    def claim_ingestion_job(self, job_id):
+        """Passa um job de queued para processing; False se ele já não está na fila (ex.: dado como interrompido)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE documents SET status = 'processing', updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'queued'
+            ''', (job_id,))
+            claimed = cursor.rowcount == 1
+            
+            conn.commit()
+            conn.close()
+            
+            return claimed
+            
+        except Exception as e:
+            logger.error(f"Erro ao iniciar job de ingestão: {e}")
+            return False
+    
+    def update_ingestion_job(self, job_id, status=None, pages_processed=None, chunk_count=None,
+                             store_doc_id=None, error_message=None):
+        """Atualiza o progresso ou o estado final de um job de ingestão"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            fields = {
+                'status': status,
+                'pages_processed': pages_processed,
+                'chunk_count': chunk_count,
+                'store_doc_id': store_doc_id,
+                'error_message': error_message
+            }
+            assignments = [(column, value) for column, value in fields.items() if value is not None]
+            if status == 'done':
+                assignments.append(('is_active', True))
+            
+            cursor.execute(f'''
+                UPDATE documents SET {', '.join(f'{column} = ?' for column, _ in assignments)},
+                       updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', [value for _, value in assignments] + [job_id])
+            
+            conn.commit()
+            conn.close()
+            
+        except Exception as e:
+            logger.error(f"Erro ao atualizar job de ingestão: {e}")
+    
+    def mark_document_deleted(self, store_doc_id):
+        """Marca como removido o registro do documento com o id do armazenamento de chunks informado"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                UPDATE documents SET status = 'deleted', is_active = FALSE, updated_at = CURRENT_TIMESTAMP
+                WHERE store_doc_id = ? AND status = 'done'
+            ''', (store_doc_id,))
+            
+            conn.commit()
+            conn.close()
+            
+        except Exception as e:
+            logger.error(f"Erro ao marcar documento como removido: {e}")
+    
+    def get_document_by_store_id(self, store_doc_id):
+        """Obtém o job que gravou o documento com o id do armazenamento de chunks informado"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT id FROM documents WHERE store_doc_id = ?
+                ORDER BY id DESC LIMIT 1
+            ''', (store_doc_id,))
+            row = cursor.fetchone()
+            
+            conn.close()
+            
+        except Exception as e:
+            logger.error(f"Erro ao obter documento: {e}")
+            return None
+        
+        return self.get_ingestion_job(row[0]) if row else None
+    
+    def get_ingestion_job(self, job_id):
+        """Obtém o estado e o progresso de um job de ingestão"""
+        jobs = self.get_ingestion_jobs([job_id])
+        return jobs[0] if jobs else None
+    
+    def get_ingestion_jobs(self, job_ids):
+        """Obtém o estado e o progresso de vários jobs de ingestão (uploads em lote), em ordem de id"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                SELECT id, original_filename, file_size, file_hash, status, pages_processed, chunk_count,
+                       store_doc_id, error_message, upload_date, updated_at
+                FROM documents WHERE id IN ({', '.join('?' for _ in job_ids)})
+                ORDER BY id
+            ''', list(job_ids))
+            jobs = cursor.fetchall()
+            
+            conn.close()
+            
+            return [
+                {
+                    'job_id': job[0],
+                    'filename': job[1],
+                    'file_size': job[2],
+                    'file_hash': job[3],
+                    'status': job[4],
+                    'pages_processed': job[5] or 0,
+                    'chunks': job[6] or 0,
+                    'document_id': job[7],
+                    'error': job[8],
+                    'created_at': job[9],
+                    'updated_at': job[10]
+                } for job in jobs
+            ]
+            
+        except Exception as e:
+            logger.error(f"Erro ao obter jobs de ingestão: {e}")
+            return None
+    
     def get_user_stats(self, user_id):
         """Obtém estatísticas de um usuário"""
         try:
@@ -0,0 +1,140 @@
+# dense_index.py - Busca vetorial local (embeddings por hashing + índice LSH aproximado)
+import zlib
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    DENSE_AVAILABLE = True
+except ImportError:
+    DENSE_AVAILABLE = False
+
+class HashingEmbedder:
+    """
+    Embedder local, sem rede e sem modelo: projeta termos, bigramas e trigramas de caracteres
+    em um vetor de dimensão fixa via feature hashing com sinal, normalizado (L2)
+    Os trigramas aproximam variações morfológicas que o stemmer não une
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def _features(self, tokens):
+        for token in tokens:
+            yield token, 1.0
+            padded = f'#{token}#'
+            for start in range(len(padded) - 2):
+                yield padded[start:start + 3], 0.5
+        for first, second in zip(tokens, tokens[1:]):
+            yield f'{first} {second}', 0.5
+
+    def embed(self, tokens):
+        """Vetor float32 normalizado a partir dos termos já analisados"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(tokens):
+            digest = zlib.crc32(feature.encode('utf-8'))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.dim] += sign * weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+class DenseIndex:
+    """
+    Índice de vizinhos mais próximos aproximado (LSH por hiperplanos aleatórios)
+    Cada tabela agrupa os vetores pela assinatura de sinais em num_bits hiperplanos; a consulta
+    visita apenas os buckets da sua assinatura (e vizinhos a 1 bit) e reordena os candidatos
+    pela similaridade de cosseno exata
+    Um chunk removido tem o vetor zerado (similaridade 0, nunca retornado); compact() o retira dos buckets
+    """
+
+    def __init__(self, embedder=None, num_tables=8, num_bits=12, seed=42):
+        if not DENSE_AVAILABLE:
+            raise ImportError("numpy é necessário para a busca vetorial")
+        self.embedder = embedder or HashingEmbedder()
+        self.dim = self.embedder.dim
+        random_state = np.random.default_rng(seed)
+        self.hyperplanes = random_state.standard_normal((num_tables, num_bits, self.dim)).astype(np.float32)
+        self._bit_weights = 1 << np.arange(num_bits)
+        self.tables = [{} for _ in range(num_tables)]
+        self.vectors = np.zeros((1024, self.dim), dtype=np.float32)
+        self.size = 0
+        # Chunks removidos ainda presentes nos buckets, com suas assinaturas
+        self._pending_compaction = {}
+        self._lock = threading.Lock()
+
+    @property
+    def num_chunks(self):
+        return self.size
+
+    def _signatures(self, vector):
+        """Assinatura (inteiro de num_bits) do vetor em cada tabela"""
+        bits = (self.hyperplanes @ vector) > 0
+        return (bits * self._bit_weights).sum(axis=1)
+
+    def add(self, chunk_id, tokens, positions=None):
+        """Indexa um chunk já analisado (ids crescentes, na ordem do document_store); posições são ignoradas"""
+        vector = self.embedder.embed(tokens)
+        signatures = self._signatures(vector)
+
+        with self._lock:
+            if chunk_id >= len(self.vectors):
+                grown = np.zeros((max(chunk_id + 1, 2 * len(self.vectors)), self.dim), dtype=np.float32)
+                grown[:self.size] = self.vectors[:self.size]
+                self.vectors = grown
+            self.vectors[chunk_id] = vector
+            self.size = max(self.size, chunk_id + 1)
+            for table, signature in zip(self.tables, signatures):
+                table.setdefault(int(signature), []).append(chunk_id)
+
+    def delete(self, chunk_id, tokens=None):
+        """Marca um chunk como removido (mesma interface do InvertedIndex)"""
+        with self._lock:
+            if chunk_id >= self.size or chunk_id in self._pending_compaction or not self.vectors[chunk_id].any():
+                return
+            self._pending_compaction[chunk_id] = self._signatures(self.vectors[chunk_id])
+            self.vectors[chunk_id] = 0
+
+    def compact(self):
+        """Retira dos buckets os chunks removidos; retorna a quantidade de chunks compactados"""
+        with self._lock:
+            pending, self._pending_compaction = self._pending_compaction, {}
+            for chunk_id, signatures in pending.items():
+                for table, signature in zip(self.tables, signatures):
+                    bucket = table.get(int(signature))
+                    if bucket is None:
+                        continue
+                    bucket.remove(chunk_id)
+                    if not bucket:
+                        del table[int(signature)]
+            return len(pending)
+
+    def search_vector(self, vector, max_results=3, min_similarity=0.0):
+        """Top-k aproximado por similaridade de cosseno para um vetor de consulta"""
+        signatures = self._signatures(vector)
+        num_bits = len(self._bit_weights)
+
+        with self._lock:
+            candidates = set()
+            for table, signature in zip(self.tables, signatures):
+                signature = int(signature)
+                # Multi-probe: bucket exato e os que diferem em um bit
+                for probe in [signature] + [signature ^ (1 << bit) for bit in range(num_bits)]:
+                    candidates.update(table.get(probe, ()))
+            if not candidates:
+                return []
+            ids = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            similarities = self.vectors[ids] @ vector
+
+        keep = similarities > min_similarity
+        ids, similarities = ids[keep], similarities[keep]
+        if len(ids) > max_results:
+            partition = np.argpartition(-similarities, max_results - 1)[:max_results]
+            ids, similarities = ids[partition], similarities[partition]
+        order = np.lexsort((ids, -similarities))
+        return [(int(ids[i]), float(similarities[i])) for i in order]
+
+    def search(self, query_tokens, max_results=3, min_similarity=0.0):
+        """Top-k aproximado para a pergunta já analisada"""
+        return self.search_vector(self.embedder.embed(query_tokens), max_results, min_similarity)
@@ -0,0 +1,262 @@
+# index_snapshot.py - Segmentos persistidos do índice invertido, compartilhados entre processos via mmap
+import os
+import json
+import mmap
+import shutil
+import logging
+from array import array
+from contextlib import ExitStack
+from search_index import PostingList
+
+logger = logging.getLogger(__name__)
+
+# Trava entre processos (workers do gunicorn); indisponível no Windows, onde há um único processo
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_FORMAT = 1
+
+# Por termo, 4 inteiros de 64 bits no terms.idx: (início em ids/tfs/starts, quantidade de chunks,
+# início em positions, quantidade de posições)
+_TERM_FIELDS = 4
+
+def _map(path, typecode):
+    """Conteúdo do arquivo mapeado em memória (somente leitura) como um array do tipo informado"""
+    if not os.path.getsize(path):
+        return memoryview(b'').cast('B').cast(typecode)
+    with open(path, 'rb') as mapped_file:
+        mapped = mmap.mmap(mapped_file.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped).cast(typecode)
+
+class IndexSegment:
+    """
+    Índice invertido somente leitura gravado por write_segment, aberto via mmap
+    Os termos ficam em ordem crescente (bytes UTF-8) e são localizados por busca binária; as listas
+    de ocorrências são fatias dos arrays mapeados, então as páginas são compartilhadas entre todos
+    os processos que abrem o mesmo segmento e nada é copiado para a memória do processo
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as meta_file:
+            meta = json.load(meta_file)
+        if meta.get('format') != _FORMAT:
+            raise ValueError(f"Formato de segmento não suportado: {meta.get('format')}")
+        self.chunks = meta['chunks']
+        self.deletions = meta['deletions']
+        self.total_length = meta['total_length']
+        self.num_deleted = meta['num_deleted']
+        self.num_terms = meta['num_terms']
+
+        with open(os.path.join(path, 'terms.dat'), 'rb') as terms_file:
+            self._text = mmap.mmap(terms_file.fileno(), 0, access=mmap.ACCESS_READ) \
+                if os.path.getsize(terms_file.name) else b''
+        self._term_offsets = _map(os.path.join(path, 'term_offsets.idx'), 'Q')
+        self._terms = _map(os.path.join(path, 'terms.idx'), 'Q')
+        self._ids = _map(os.path.join(path, 'ids.idx'), 'I')
+        self._tfs = _map(os.path.join(path, 'tfs.idx'), 'I')
+        self._starts = _map(os.path.join(path, 'starts.idx'), 'I')
+        self._positions = _map(os.path.join(path, 'positions.idx'), 'I')
+        self.lengths = _map(os.path.join(path, 'lengths.idx'), 'i')
+
+    def _term(self, number):
+        return self._text[self._term_offsets[number]:self._term_offsets[number + 1]]
+
+    def _find(self, term):
+        """Número do termo no segmento, ou None"""
+        encoded = term.encode('utf-8')
+        low, high = 0, self.num_terms
+        while low < high:
+            middle = (low + high) // 2
+            if self._term(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.num_terms and self._term(low) == encoded:
+            return low
+        return None
+
+    def postings(self, term):
+        """Lista de ocorrências do termo com fatias dos arrays mapeados, ou None"""
+        number = self._find(term)
+        if number is None:
+            return None
+        base = number * _TERM_FIELDS
+        start, count, positions_start, positions_count = self._terms[base:base + _TERM_FIELDS]
+        postings = PostingList()
+        postings.ids = self._ids[start:start + count]
+        postings.tfs = self._tfs[start:start + count]
+        postings.starts = self._starts[start:start + count]
+        postings.positions = self._positions[positions_start:positions_start + positions_count]
+        return postings
+
+    def terms(self):
+        for number in range(self.num_terms):
+            yield str(self._term(number), 'utf-8')
+
+def write_segment(index, path, chunks, deletions):
+    """
+    Grava o estado atual do InvertedIndex (sem os chunks removidos) como um segmento em path
+    chunks e deletions: chunks do armazenamento e documentos removidos que o índice já incorpora
+    Os arrays são gravados termo a termo, sem montar o segmento inteiro em memória
+    """
+    os.makedirs(path)
+    lengths = index.chunk_lengths()
+    term_offsets = array('Q', (0,))
+    terms = array('Q')
+    ids_written = positions_written = text_written = 0
+
+    with ExitStack() as stack:
+        files = {name: stack.enter_context(open(os.path.join(path, f'{name}.idx'), 'wb'))
+                 for name in ('ids', 'tfs', 'starts', 'positions')}
+        text_file = stack.enter_context(open(os.path.join(path, 'terms.dat'), 'wb'))
+
+        for term, ids, tfs, positions in index.live_postings():
+            encoded = term.encode('utf-8')
+            text_file.write(encoded)
+            text_written += len(encoded)
+            term_offsets.append(text_written)
+
+            starts = array('I')
+            flat = array('I')
+            for chunk_positions in positions:
+                starts.append(len(flat))
+                flat.extend(chunk_positions)
+            files['ids'].write(array('I', ids).tobytes())
+            files['tfs'].write(array('I', tfs).tobytes())
+            files['starts'].write(starts.tobytes())
+            files['positions'].write(flat.tobytes())
+            terms.extend((ids_written, len(ids), positions_written, len(flat)))
+            ids_written += len(ids)
+            positions_written += len(flat)
+
+        for written in list(files.values()) + [text_file]:
+            written.flush()
+            os.fsync(written.fileno())
+
+    for name, values in (('term_offsets', term_offsets), ('terms', terms), ('lengths', lengths)):
+        with open(os.path.join(path, f'{name}.idx'), 'wb') as array_file:
+            array_file.write(values.tobytes())
+            array_file.flush()
+            os.fsync(array_file.fileno())
+
+    # meta.json por último: um segmento sem ele está incompleto e nunca é publicado
+    meta = {
+        'format': _FORMAT,
+        'chunks': chunks,
+        'deletions': deletions,
+        'total_length': sum(length for length in lengths if length > 0),
+        'num_deleted': sum(1 for length in lengths if length < 0),
+        'num_terms': len(term_offsets) - 1
+    }
+    with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as meta_file:
+        json.dump(meta, meta_file)
+        meta_file.flush()
+        os.fsync(meta_file.fileno())
+    return meta
+
+class IndexSnapshots:
+    """
+    Diretório de segmentos do índice invertido compartilhado pelos workers do gunicorn
+    Um worker grava periodicamente o seu índice como um novo segmento (publish) e o arquivo CURRENT
+    passa a apontar para ele (rename atômico); os demais verificam CURRENT antes das consultas
+    (latest) e, se o segmento é tão atual quanto o seu índice, passam a usá-lo, descartando as listas
+    em memória. Assim as listas de ocorrências e as posições ficam uma única vez no cache de páginas
+    do sistema, e um processo reiniciado abre o segmento em vez de reconstruir o índice
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.current_path = os.path.join(directory, 'CURRENT')
+        self.lock_path = os.path.join(directory, 'snapshot.lock')
+        self._current_stat = None
+
+    def _read_current(self):
+        try:
+            with open(self.current_path, encoding='utf-8') as current_file:
+                return current_file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def latest(self, force=False):
+        """
+        Segmento publicado mais recente se CURRENT mudou desde a última verificação (ou force), senão None
+        Custa um stat quando nada mudou
+        """
+        try:
+            stat = os.stat(self.current_path)
+        except FileNotFoundError:
+            return None
+        current_stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if current_stat == self._current_stat and not force:
+            return None
+        self._current_stat = current_stat
+
+        name = self._read_current()
+        if name is None:
+            return None
+        try:
+            return IndexSegment(os.path.join(self.directory, name))
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Segmento do índice {name} ilegível: {e}")
+            return None
+
+    def publish(self, index, chunks, deletions):
+        """
+        Grava o índice como um novo segmento e o publica; retorna o segmento, ou None se outro
+        processo está gravando ou já publicou um segmento tão atual quanto este
+        """
+        with open(self.lock_path, 'a') as lock_file:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return None
+            try:
+                current = self._read_current()
+                if current is not None:
+                    try:
+                        with open(os.path.join(self.directory, current, 'meta.json'), encoding='utf-8') as meta_file:
+                            meta = json.load(meta_file)
+                        if meta['chunks'] >= chunks and meta['deletions'] >= deletions:
+                            return None
+                    except (OSError, ValueError, KeyError):
+                        pass
+
+                generation = int(current.split('-')[1]) + 1 if current else 1
+                name = f'segment-{generation:08d}'
+                staged = os.path.join(self.directory, f'{name}.tmp')
+                shutil.rmtree(staged, ignore_errors=True)
+                try:
+                    write_segment(index, staged, chunks, deletions)
+                    os.replace(staged, os.path.join(self.directory, name))
+                except Exception:
+                    shutil.rmtree(staged, ignore_errors=True)
+                    raise
+
+                with open(f'{self.current_path}.tmp', 'w', encoding='utf-8') as current_file:
+                    current_file.write(name)
+                    current_file.flush()
+                    os.fsync(current_file.fileno())
+                os.replace(f'{self.current_path}.tmp', self.current_path)
+                # O próprio processo já usa o segmento: latest() não o reabre
+                stat = os.stat(self.current_path)
+                self._current_stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                self._remove_old(keep=(name, current))
+                logger.info(f"Segmento do índice {name} publicado: {chunks} chunks")
+                return IndexSegment(os.path.join(self.directory, name))
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _remove_old(self, keep):
+        """
+        Remove os segmentos anteriores ao atual e ao imediatamente anterior (que um processo pode
+        estar abrindo agora); arquivos ainda mapeados continuam acessíveis até serem fechados
+        """
+        for entry in os.listdir(self.directory):
+            if entry.startswith('segment-') and entry not in keep:
+                shutil.rmtree(os.path.join(self.directory, entry), ignore_errors=True)
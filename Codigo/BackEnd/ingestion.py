@@ -0,0 +1,649 @@
+# ingestion.py - Pipeline de ingestão de PDFs em streaming, página a página
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import multiprocessing
+from collections import deque
+from bisect import bisect_right
+from difflib import SequenceMatcher
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+class EmptyDocumentError(ValueError):
+    """O documento não contém texto extraível"""
+
+class FixedSizeSplitter:
+    """
+    Divisor incremental em chunks de tamanho fixo com sobreposição
+    Recebe o texto em partes (páginas) e emite os intervalos (início, fim) assim que ficam completos;
+    produz exatamente os mesmos intervalos que dividir o texto inteiro de uma vez
+    """
+
+    def __init__(self, chunk_size=1000, overlap=200):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.length = 0
+        self.next_start = 0
+
+    @property
+    def retain_from(self):
+        """Menor posição que um chunk futuro ainda pode referenciar"""
+        return self.next_start
+
+    def feed(self, text):
+        """Acrescenta texto e retorna os chunks que ficaram completos"""
+        self.length += len(text)
+        spans = []
+        while self.next_start + self.chunk_size <= self.length:
+            spans.append((self.next_start, self.next_start + self.chunk_size))
+            self.next_start += self.chunk_size - self.overlap
+        return spans
+
+    def finish(self):
+        """Retorna os chunks restantes ao fim do documento"""
+        spans = []
+        while self.next_start < self.length:
+            spans.append((self.next_start, min(self.next_start + self.chunk_size, self.length)))
+            self.next_start += self.chunk_size - self.overlap
+        return spans
+
+def split_text_spans(text, chunk_size=1000, overlap=200):
+    """Intervalos (início, fim) dos chunks de um texto completo"""
+    splitter = FixedSizeSplitter(chunk_size, overlap)
+    return splitter.feed(text) + splitter.finish()
+
+# Fronteiras de frase (pontuação final seguida de espaço) e de parágrafo (linha em branco)
+_SENTENCE_BOUNDARY_RE = re.compile(r'(?<=[.!?;])\s+|\n\s*\n')
+# Fronteiras de reserva para texto sem frases (tabelas, calendários, listas): quebra de linha e espaço
+_LINE_BOUNDARY_RE = re.compile(r'[ \t\r\f\v]*\n\s*')
+_SPACE_RE = re.compile(r'\s+')
+_WORD_RE = re.compile(r'\S+\s*')
+
+class SentenceSplitter:
+    """
+    Divisor incremental por frases e parágrafos, com chunks dimensionados em tokens
+    Frases completas são acumuladas até chunk_tokens; o chunk seguinte repete as últimas frases
+    do anterior que somam até overlap_tokens. Frases maiores que chunk_tokens são divididas entre
+    palavras. Emite (início, fim, tokens do chunk); o texto é retido apenas a partir da primeira
+    frase ainda referenciável
+    Se o texto sem fronteira de frase passa de chunk_tokens, as quebras de linha (e, sem elas, o
+    último espaço) servem de fronteira: a retenção e a varredura por página continuam limitadas
+    """
+
+    def __init__(self, chunk_tokens=256, overlap_tokens=32, counter=None):
+        from tokenization import TokenCounter
+
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.counter = counter or TokenCounter()
+        self.length = 0
+        # Texto retido, a partir da posição _text_start do documento
+        self._text = ''
+        self._text_start = 0
+        # Início do trecho ainda sem fronteira de frase confirmada
+        self._scan = 0
+        # Frases (início, fim, tokens) do chunk em formação; as primeiras podem vir da sobreposição
+        self._sentences = deque()
+        self._tokens = 0
+        self._has_new = False
+
+    @property
+    def retain_from(self):
+        return self._sentences[0][0] if self._sentences else self._scan
+
+    def _slice(self, start, end):
+        return self._text[start - self._text_start:end - self._text_start]
+
+    def feed(self, text):
+        self._text += text
+        self.length += len(text)
+
+        spans = self._confirm(_SENTENCE_BOUNDARY_RE.finditer(self._pending()))
+        if self._pending_exceeds():
+            spans.extend(self._confirm(_LINE_BOUNDARY_RE.finditer(self._pending())))
+        if self._pending_exceeds():
+            # Uma única linha longa: confirmada até o último espaço, dividida entre palavras
+            pending = self._pending()
+            last = None
+            for match in _SPACE_RE.finditer(pending):
+                if match.end() < len(pending):
+                    last = match
+            spans.extend(self._confirm([last] if last else []))
+        self._release()
+        return spans
+
+    def _pending(self):
+        """Texto ainda sem fronteira confirmada"""
+        return self._slice(self._scan, self.length)
+
+    def _pending_exceeds(self):
+        pending = self._pending()
+        return len(pending) > self.chunk_tokens and self.counter.count(pending) > self.chunk_tokens
+
+    def _confirm(self, matches):
+        """Acrescenta as frases terminadas nas fronteiras encontradas no texto pendente"""
+        spans = []
+        base = self._scan
+        length = self.length - base
+        for match in matches:
+            # Espaço no fim do texto pode continuar na próxima página: a fronteira ainda não é definitiva
+            if match.end() == length:
+                break
+            spans.extend(self._add_sentence(self._scan, base + match.start()))
+            self._scan = base + match.end()
+        return spans
+
+    def finish(self):
+        spans = self._add_sentence(self._scan, self.length)
+        self._scan = self.length
+        if self._has_new:
+            spans.append(self._emit())
+        self._sentences.clear()
+        self._release()
+        return spans
+
+    def _release(self):
+        cut = self.retain_from - self._text_start
+        if cut > 0:
+            self._text = self._text[cut:]
+            self._text_start += cut
+
+    def _add_sentence(self, start, end):
+        """Acrescenta uma frase (sem os espaços das bordas) ao chunk em formação"""
+        text = self._slice(start, end)
+        stripped = text.strip()
+        if not stripped:
+            return []
+        start += len(text) - len(text.lstrip())
+        end = start + len(stripped)
+
+        tokens = self.counter.count(stripped)
+        if tokens <= self.chunk_tokens:
+            return self._add(start, end, tokens)
+
+        # Frase longa demais para um chunk: dividida em trechos de palavras inteiras
+        spans = []
+        piece_start, piece_tokens = start, 0
+        for match in _WORD_RE.finditer(stripped):
+            word_tokens = self.counter.count(match.group())
+            if piece_tokens and piece_tokens + word_tokens > self.chunk_tokens:
+                spans.extend(self._add_sentence(piece_start, start + match.start()))
+                piece_start, piece_tokens = start + match.start(), 0
+            piece_tokens += word_tokens
+        if piece_tokens > self.chunk_tokens:
+            # Uma única "palavra" maior que o chunk: cortada por caracteres
+            size = max((end - piece_start) * self.chunk_tokens // piece_tokens, 1)
+            for position in range(piece_start, end, size):
+                piece_end = min(position + size, end)
+                spans.extend(self._add(position, piece_end, self.counter.count(self._slice(position, piece_end))))
+            return spans
+        spans.extend(self._add(piece_start, end, self.counter.count(self._slice(piece_start, end))))
+        return spans
+
+    def _add(self, start, end, tokens):
+        spans = []
+        if self._has_new and self._tokens + tokens > self.chunk_tokens:
+            spans.append(self._emit())
+        # Frases da sobreposição saem primeiro se não couberem junto com a nova
+        while not self._has_new and self._sentences and self._tokens + tokens > self.chunk_tokens:
+            self._tokens -= self._sentences.popleft()[2]
+        self._sentences.append((start, end, tokens))
+        self._tokens += tokens
+        self._has_new = True
+        return spans
+
+    def _emit(self):
+        """Fecha o chunk em formação e mantém as últimas frases como sobreposição do próximo"""
+        start, end = self._sentences[0][0], self._sentences[-1][1]
+        span = (start, end, self.counter.count(self._slice(start, end)))
+
+        overlap = deque()
+        overlap_tokens = 0
+        for sentence in reversed(self._sentences):
+            if overlap_tokens + sentence[2] > self.overlap_tokens or len(overlap) + 1 == len(self._sentences):
+                break
+            overlap.appendleft(sentence)
+            overlap_tokens += sentence[2]
+        self._sentences = overlap
+        self._tokens = overlap_tokens
+        self._has_new = False
+        return span
+
+class IncrementalSplitter:
+    """
+    Divisor para uma nova versão de um documento já processado
+    Os chunks da versão anterior contidos inteiramente em páginas inalteradas (e consecutivas nas
+    duas versões) são mantidos, deslocados para a nova posição; apenas os trechos não cobertos por
+    eles (páginas alteradas e suas bordas) são divididos por um novo divisor (make_splitter).
+    As páginas devem ser alimentadas uma por chamada de feed(): os chunks mantidos saem assim que
+    o seu texto chega e os trechos alterados são divididos à medida que são lidos, então só a
+    janela de texto ainda referenciável fica retida, como nos demais divisores
+    Os chunks mantidos preservam texto, limites e contagem de tokens, mas recebem novos ids no
+    armazenamento: os índices de busca os analisam de novo, como os chunks das páginas alteradas
+    """
+
+    def __init__(self, old_page_lengths, old_spans, page_matches, make_splitter=FixedSizeSplitter):
+        # page_matches: página da nova versão → página idêntica da versão anterior
+        # old_spans: (início, fim[, tokens]) dos chunks da versão anterior
+        self.make_splitter = make_splitter
+        # Divisores de tamanho fixo sobrepõem os trechos divididos aos chunks vizinhos
+        self.overlap = getattr(make_splitter(), 'overlap', 0)
+        self._plan = deque(self._kept_plan(old_page_lengths, old_spans, page_matches))
+        # Chunks mantidos já posicionados na nova versão, ainda não emitidos
+        self._kept = deque()
+        self.page_count = 0
+        self.length = 0
+        # Texto retido, a partir da posição _text_start
+        self._text = ''
+        self._text_start = 0
+        # Fim do texto coberto pelos chunks mantidos já emitidos
+        self._covered = 0
+        # Trecho em divisão: [divisor, início, posição até onde o texto já foi passado ao divisor]
+        self._gap = None
+        self.kept_count = 0
+
+    @staticmethod
+    def _kept_plan(old_page_lengths, old_spans, page_matches):
+        """
+        Chunks da versão anterior que continuam válidos, como (página da nova versão, deslocamento
+        na página, tamanho, demais campos), em ordem de posição na nova versão
+        """
+        old_starts = [0]
+        for length in old_page_lengths:
+            old_starts.append(old_starts[-1] + length)
+        new_page_of = {old: new for new, old in page_matches.items()}
+
+        plan = []
+        for start, end, *rest in old_spans:
+            first = bisect_right(old_starts, start) - 1
+            last = bisect_right(old_starts, end - 1) - 1
+            if first not in new_page_of or any(new_page_of.get(page) != new_page_of[first] + page - first
+                                               for page in range(first + 1, last + 1)):
+                continue
+            plan.append((new_page_of[first], start - old_starts[first], end - start, tuple(rest)))
+        return sorted(set(plan))
+
+    @property
+    def retain_from(self):
+        if self._gap is not None:
+            position = self._gap[1] + self._gap[0].retain_from
+        else:
+            position = self._covered - self.overlap
+        # Um trecho futuro começa overlap antes do fim do próximo chunk mantido (ou do texto já lido)
+        if self._kept:
+            position = min(position, self._kept[0][0], self._kept[0][1] - self.overlap)
+        else:
+            position = min(position, self.length - self.overlap)
+        return max(position, 0, self._text_start)
+
+    def _slice(self, start, end):
+        return self._text[start - self._text_start:end - self._text_start]
+
+    def feed(self, text):
+        page_start = self.length
+        self._text += text
+        self.length += len(text)
+        while self._plan and self._plan[0][0] <= self.page_count:
+            page, offset, size, rest = self._plan.popleft()
+            if page == self.page_count:
+                self._kept.append((page_start + offset, page_start + offset + size, *rest))
+        self.page_count += 1
+
+        spans = self._advance(final=False)
+        self._release()
+        return spans
+
+    def finish(self):
+        spans = self._advance(final=True)
+        self._plan.clear()
+        self._kept.clear()
+        self._release()
+        return spans
+
+    def _advance(self, final):
+        """Emite os chunks mantidos cujo texto já chegou e divide os trechos entre eles"""
+        spans = []
+        while self._kept:
+            start, end = self._kept[0][0], self._kept[0][1]
+            if start > self._covered:
+                # Trecho sem chunk antes do mantido: sobrepõe o chunk anterior e o seguinte como o divisor faria
+                if self._gap is None:
+                    self._open_gap()
+                gap_end = min(start + self.overlap, self.length)
+                if start + self.overlap > self.length and not final:
+                    spans.extend(self._feed_gap(self.length))
+                    return spans
+                spans.extend(self._close_gap(gap_end))
+                # O trecho até o chunk mantido já foi dividido, mesmo que o chunk ainda não tenha terminado
+                self._covered = start
+            if end > self.length:
+                if not final:
+                    return spans
+                self._kept.popleft()
+                continue
+            spans.append(self._kept.popleft())
+            self.kept_count += 1
+            self._covered = max(self._covered, end)
+
+        # Sem chunk mantido posicionado: o texto após o último é dividido (até o próximo, se houver)
+        if self._covered < self.length:
+            if self._gap is None:
+                self._open_gap()
+            spans.extend(self._close_gap(self.length) if final else self._feed_gap(self.length))
+        return spans
+
+    def _open_gap(self):
+        gap_start = max(self._covered - self.overlap, 0, self._text_start)
+        self._gap = [self.make_splitter(), gap_start, gap_start]
+
+    def _feed_gap(self, end):
+        splitter, gap_start, fed = self._gap
+        if end <= fed:
+            return []
+        self._gap[2] = end
+        return [(gap_start + span_start, gap_start + span_end, *rest)
+                for span_start, span_end, *rest in splitter.feed(self._slice(fed, end))]
+
+    def _close_gap(self, end):
+        spans = self._feed_gap(end)
+        splitter, gap_start, _ = self._gap
+        spans.extend((gap_start + span_start, gap_start + span_end, *rest)
+                     for span_start, span_end, *rest in splitter.finish())
+        self._gap = None
+        return spans
+
+    def _release(self):
+        cut = self.retain_from - self._text_start
+        if cut > 0:
+            self._text = self._text[cut:]
+            self._text_start += cut
+
+def match_pages(old_hashes, new_hashes):
+    """Página da nova versão → página idêntica (mesmo hash) da versão anterior, preservando a ordem"""
+    matcher = SequenceMatcher(None, old_hashes, new_hashes, autojunk=False)
+    return {new + offset: old + offset
+            for old, new, size in matcher.get_matching_blocks()
+            for offset in range(size)}
+
+# Versão do cálculo dos hashes de página: hashes de outra versão (ex.: só o content stream) não são comparados
+PAGE_HASH_FORMAT = 2
+
+# Referências para cima na árvore do PDF (página mãe): não fazem parte do que a página desenha
+_PARENT_KEYS = frozenset(('/Parent', '/P'))
+
+def _pdf_object_digest(obj, memo, visiting):
+    """
+    Hash de um objeto do PDF com as referências indiretas resolvidas (dicionários, listas e streams)
+    memo guarda o hash de cada objeto indireto já visto: fontes e XObjects compartilhados entre as
+    páginas são lidos uma única vez; visiting interrompe referências circulares
+    """
+    from PyPDF2.generic import IndirectObject
+
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key in memo:
+            return memo[key]
+        if key in visiting:
+            return b'cycle'
+        visiting.add(key)
+        try:
+            digest = _pdf_object_digest(obj.get_object(), memo, visiting)
+        finally:
+            visiting.discard(key)
+        memo[key] = digest
+        return digest
+
+    digest = hashlib.sha256(type(obj).__name__.encode('utf-8'))
+    if isinstance(obj, dict):
+        for key in sorted(obj):
+            if key not in _PARENT_KEYS:
+                digest.update(str(key).encode('utf-8'))
+                digest.update(_pdf_object_digest(obj[key], memo, visiting))
+        # Dados do stream como estão no arquivo (sem decodificar imagens e fontes)
+        data = getattr(obj, '_data', None)
+        if data is not None:
+            digest.update(data if isinstance(data, bytes) else str(data).encode('utf-8'))
+    elif isinstance(obj, list):
+        for item in obj:
+            digest.update(_pdf_object_digest(item, memo, visiting))
+    else:
+        digest.update(repr(obj).encode('utf-8'))
+    return digest.digest()
+
+def pdf_page_hashes(stream):
+    """
+    Hash de cada página do PDF, calculado sem extrair o texto: content stream, recursos usados por
+    ele (fontes, XObjects e seus próprios recursos, resolvidos) e rotação
+    Páginas com o mesmo content stream mas recursos diferentes (ex.: '/Fm0 Do' com um XObject
+    próprio por página, ou outra codificação de fonte) têm hashes diferentes
+    """
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(stream)
+    memo = {}
+    hashes = []
+    for page in reader.pages:
+        contents = page.get_contents()
+        digest = hashlib.sha256(contents.get_data() if contents is not None else b'')
+        digest.update(_pdf_object_digest(page.get('/Resources'), memo, set()))
+        digest.update(repr(page.get('/Rotate', 0)).encode('utf-8'))
+        hashes.append(digest.hexdigest())
+    return hashes
+
+def iter_pdf_pages(stream, page_numbers=None):
+    """
+    Extrai o texto do PDF uma página por vez (todas, ou apenas as de page_numbers, em ordem)
+    O stream pode ser o arquivo temporário do upload (já em disco para arquivos grandes)
+    """
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(stream)
+    if page_numbers is None:
+        page_numbers = range(len(reader.pages))
+    for number in page_numbers:
+        yield (reader.pages[number].extract_text() or '') + "\n"
+
+def merge_pages(page_count, reused, extracted, old_pages):
+    """
+    Texto de todas as páginas: nas de reused (página → página da versão anterior, crescente),
+    o texto da versão anterior, lido em sequência de old_pages; nas demais, o extraído, em ordem
+    """
+    extracted = iter(extracted)
+    old_pages = enumerate(old_pages)
+    for number in range(page_count):
+        if number not in reused:
+            yield next(extracted)
+            continue
+        for old_number, text in old_pages:
+            if old_number == reused[number]:
+                yield text
+                break
+        else:
+            raise ValueError(f'página {reused[number]} ausente da versão anterior')
+
+def _extract_page_range(task):
+    """Executado nos processos do pool: extrai o texto de um grupo de páginas do PDF em disco"""
+    from PyPDF2 import PdfReader
+
+    path, page_numbers = task
+    reader = PdfReader(path)
+    return [(reader.pages[number].extract_text() or '') + "\n" for number in page_numbers]
+
+def _warm_up():
+    return True
+
+class ParallelPageExtractor:
+    """
+    Extração de texto distribuída entre processos, por intervalos de páginas
+    O PDF é copiado para um arquivo temporário que cada processo abre; os intervalos são
+    submetidos em uma janela deslizante e os textos são devolvidos na ordem das páginas,
+    alimentando o mesmo pipeline em streaming. PDFs pequenos são extraídos no próprio processo.
+    """
+
+    def __init__(self, max_workers, pages_per_task=8, min_pages=16):
+        self.max_workers = max_workers
+        self.pages_per_task = pages_per_task
+        self.min_pages = min_pages
+        # fork evita reimportar o app nos processos; por isso o pool é criado e seus processos
+        # iniciados na importação do app, antes de qualquer thread
+        self.executor = ProcessPoolExecutor(max_workers, mp_context=multiprocessing.get_context('fork'))
+        self.executor.submit(_warm_up).result()
+
+    @staticmethod
+    def available():
+        return 'fork' in multiprocessing.get_all_start_methods()
+
+    def iter_pages(self, stream, page_numbers=None):
+        """Mesma interface de iter_pdf_pages: texto de cada página (ou das de page_numbers), em ordem"""
+        from PyPDF2 import PdfReader
+
+        reader = PdfReader(stream)
+        if page_numbers is None:
+            page_numbers = range(len(reader.pages))
+        page_numbers = list(page_numbers)
+        if len(page_numbers) < self.min_pages:
+            for number in page_numbers:
+                yield (reader.pages[number].extract_text() or '') + "\n"
+            return
+
+        stream.seek(0)
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as staged:
+            shutil.copyfileobj(stream, staged)
+        try:
+            tasks = deque((staged.name, page_numbers[start:start + self.pages_per_task])
+                          for start in range(0, len(page_numbers), self.pages_per_task))
+            pending = deque()
+            broken = False
+            while tasks or pending:
+                # Janela limitada de intervalos em andamento: memória proporcional aos workers
+                while tasks and len(pending) < 2 * self.max_workers:
+                    task = tasks.popleft()
+                    future = None
+                    if not broken:
+                        try:
+                            future = self.executor.submit(_extract_page_range, task)
+                        except BrokenProcessPool:
+                            broken = True
+                    pending.append((task, future))
+
+                task, future = pending.popleft()
+                texts = None
+                if future is not None:
+                    try:
+                        texts = future.result()
+                    except BrokenProcessPool:
+                        broken = True
+                if texts is None:
+                    logger.error("Pool de extração indisponível, extraindo no próprio processo")
+                    texts = _extract_page_range(task)
+                yield from texts
+        finally:
+            os.unlink(staged.name)
+
+class ExtractionCache:
+    """
+    Cache persistente do texto extraído dos PDFs, indexado pelo hash do conteúdo do arquivo
+    Cada entrada guarda as páginas em ordem (uma string JSON por linha, comprimida com gzip) e,
+    em um arquivo ao lado, o hash do conteúdo de cada página; um PDF já visto é reprocessado a
+    partir do cache, sem nova extração, e uma nova versão reaproveita as páginas inalteradas
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, file_hash):
+        return os.path.join(self.cache_dir, f'{file_hash}.jsonl.gz')
+
+    def _hashes_path(self, file_hash):
+        return os.path.join(self.cache_dir, f'{file_hash}.pages.json')
+
+    def __contains__(self, file_hash):
+        return os.path.exists(self._path(file_hash))
+
+    def iter_pages(self, file_hash):
+        """Texto de cada página, na mesma forma produzida por iter_pdf_pages"""
+        with gzip.open(self._path(file_hash), 'rt', encoding='utf-8') as cached:
+            for line in cached:
+                yield json.loads(line)
+
+    def page_hashes(self, file_hash):
+        """Hashes das páginas da entrada, ou None se não foram registrados (ou com outro PAGE_HASH_FORMAT)"""
+        try:
+            with open(self._hashes_path(file_hash), encoding='utf-8') as hashes_file:
+                recorded = json.load(hashes_file)
+        except FileNotFoundError:
+            return None
+        # Entradas antigas guardam só a lista, com hashes apenas do content stream
+        if not isinstance(recorded, dict) or recorded.get('format') != PAGE_HASH_FORMAT:
+            return None
+        return recorded['pages']
+
+    def record_page_hashes(self, file_hash, page_hashes):
+        """Grava (ou atualiza) os hashes das páginas de uma entrada"""
+        fd, staged = tempfile.mkstemp(dir=self.cache_dir, suffix='.pages')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as hashes_file:
+                json.dump({'format': PAGE_HASH_FORMAT, 'pages': page_hashes}, hashes_file)
+            os.replace(staged, self._hashes_path(file_hash))
+        finally:
+            if os.path.exists(staged):
+                os.unlink(staged)
+
+    def record(self, file_hash, pages, page_hashes=None):
+        """
+        Repassa as páginas adiante gravando-as no cache
+        A entrada só é publicada (rename atômico) se todas as páginas forem consumidas
+        """
+        fd, staged = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as raw, gzip.open(raw, 'wt', encoding='utf-8') as cached:
+                for text in pages:
+                    cached.write(json.dumps(text, ensure_ascii=False) + '\n')
+                    yield text
+            # Os hashes são publicados antes das páginas: toda entrada visível já tem os seus
+            if page_hashes is not None:
+                self.record_page_hashes(file_hash, page_hashes)
+            os.replace(staged, self._path(file_hash))
+        finally:
+            if os.path.exists(staged):
+                os.unlink(staged)
+
+def ingest_document(pages, store, filename, uploaded_by=None, uploaded_at=None, splitter=None,
+                    progress=None, file_size=None, file_hash=None):
+    """
+    Consome as páginas em sequência: cada página é gravada no arquivo temporário do documento e os
+    chunks são emitidos assim que completos; o armazenamento só é travado no commit final.
+    A memória fica limitada à janela de texto que ainda pode pertencer a um chunk futuro,
+    e o custo é linear no tamanho do documento.
+    progress(páginas processadas, chunks emitidos) é chamado após cada página.
+    Retorna (doc_id, id do primeiro chunk, quantidade de chunks)
+    """
+    splitter = splitter or FixedSizeSplitter()
+    has_text = False
+
+    with store.open_document(filename, uploaded_by, uploaded_at, file_size, file_hash) as writer:
+        for page_count, text in enumerate(pages, start=1):
+            has_text = has_text or bool(text.strip())
+            writer.write(text)
+            for span in splitter.feed(text):
+                writer.add_chunk(*span)
+            writer.release(splitter.retain_from)
+            if progress:
+                progress(page_count, writer.chunk_count)
+
+        if not has_text:
+            raise EmptyDocumentError('PDF não contém texto legível')
+
+        for span in splitter.finish():
+            writer.add_chunk(*span)
+        doc_id, first_chunk_id = writer.commit()
+
+    return doc_id, first_chunk_id, writer.chunk_count
@@ -0,0 +1,322 @@
+# ingestion_queue.py - Fila de jobs de ingestão processados em segundo plano
+import os
+import time
+import uuid
+import socket
+import hashlib
+import logging
+import threading
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+from ingestion import (EmptyDocumentError, FixedSizeSplitter, IncrementalSplitter, pdf_page_hashes, match_pages,
+                       merge_pages)
+
+logger = logging.getLogger(__name__)
+
+class UploadTooLargeError(ValueError):
+    """O conteúdo enviado passa do limite de tamanho (ex.: membro de ZIP descompactado)"""
+
+class IngestionBatch:
+    """
+    Jobs enviados juntos (upload em lote): os índices são atualizados uma vez a cada
+    index_every documentos gravados e ao fim do lote, em vez de uma vez por documento
+    """
+
+    def __init__(self, index_every=20):
+        self.index_every = index_every
+        self.pending = 0
+        self.closed = False
+        self.stored = []
+        self._lock = threading.Lock()
+
+    def add(self):
+        with self._lock:
+            self.pending += 1
+
+    def finish(self, job_id=None):
+        """Registra o fim do processamento de um job (job_id None se falhou); retorna os jobs a indexar agora"""
+        with self._lock:
+            self.pending -= 1
+            if job_id is not None:
+                self.stored.append(job_id)
+            return self._take_ready()
+
+    def close(self):
+        """Nenhum job será acrescentado; retorna os jobs a indexar agora"""
+        with self._lock:
+            self.closed = True
+            return self._take_ready()
+
+    def _take_ready(self):
+        if self.stored and (len(self.stored) >= self.index_every or (self.closed and not self.pending)):
+            ready, self.stored = self.stored, []
+            return ready
+        return []
+
+class IngestionQueue:
+    """
+    Jobs de ingestão de PDFs executados por threads em segundo plano
+    O upload é gravado em um diretório de staging e o job é registrado na tabela documents;
+    o estado (queued → processing → indexing → done/failed) e o progresso ficam no banco,
+    de modo que qualquer worker do gunicorn responde à consulta de um job
+    O conteúdo é identificado pelo SHA-256 calculado durante a gravação: um PDF já processado
+    (ou em processamento) não gera novo job, e o texto extraído é reaproveitado do cache
+    Uma nova versão de um documento é comparada página a página (hash do conteúdo) com a anterior:
+    só as páginas alteradas são extraídas e divididas, e os demais chunks são mantidos
+    Cada job pertence ao processo que o recebeu, que renova o seu heartbeat no banco a cada
+    stale_seconds / 5 enquanto ele espera na fila ou é processado. Jobs de um processo finalizado
+    (sem arquivo em staging ou sem heartbeat há stale_seconds) são dados como falha na
+    inicialização e não bloqueiam novos envios do conteúdo; os de um processo vivo não são
+    afetados, por mais que esperem na fila
+    """
+
+    def __init__(self, db_manager, staging_dir, extract_pages, ingest, index, remove=None,
+                 extraction_cache=None, store=None, make_splitter=FixedSizeSplitter, max_workers=1,
+                 progress_interval=1.0, stale_seconds=300):
+        # extract_pages(stream, page_numbers=None) → texto das páginas do PDF (ou das informadas), em ordem
+        # ingest(páginas, nome do arquivo, usuário, progress, splitter, tamanho, hash) → (doc_id, quantidade de chunks)
+        # index() incorpora aos índices de busca os chunks gravados e as remoções
+        # remove(doc_id) remove o documento substituído por um job (ver submit(replaces=...))
+        # store: armazenamento de chunks, de onde vêm os chunks da versão anterior
+        # make_splitter() → divisor usado nos trechos alterados de uma nova versão
+        self.db_manager = db_manager
+        self.staging_dir = staging_dir
+        self.extract_pages = extract_pages
+        self.ingest = ingest
+        self.index = index
+        self.remove = remove
+        self.extraction_cache = extraction_cache
+        self.store = store
+        self.make_splitter = make_splitter
+        self.progress_interval = progress_interval
+        self.stale_seconds = stale_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingestion')
+        self._owner = None
+        self._owner_pid = None
+        self._owner_lock = threading.Lock()
+        os.makedirs(staging_dir, exist_ok=True)
+        self.db_manager.recover_ingestion_jobs(staging_dir, stale_seconds)
+
+    def _owner_id(self):
+        """
+        Identificador deste processo como dono dos jobs que ele enfileira
+        Definido no primeiro envio de cada processo (a fila pode ser criada antes do fork dos
+        workers do gunicorn), que também inicia a thread de heartbeat
+        """
+        with self._owner_lock:
+            if self._owner_pid != os.getpid():
+                self._owner_pid = os.getpid()
+                self._owner = f'{socket.gethostname()}:{self._owner_pid}:{uuid.uuid4().hex[:8]}'
+                threading.Thread(target=self._heartbeat, args=(self._owner,),
+                                 name='ingestion-heartbeat', daemon=True).start()
+            return self._owner
+
+    def _heartbeat(self, owner):
+        """Renova periodicamente os jobs deste processo, inclusive os que ainda esperam na fila"""
+        interval = max(self.stale_seconds / 5, 1)
+        while True:
+            time.sleep(interval)
+            self.db_manager.heartbeat_ingestion_jobs(owner)
+
+    def _stage(self, stream, max_bytes=None):
+        """
+        Grava o upload em staging calculando o hash em uma única passada
+        Interrompe com UploadTooLargeError ao passar de max_bytes (limite aplicado durante a leitura)
+        """
+        path = os.path.join(self.staging_dir, f'{uuid.uuid4().hex}.pdf')
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(path, 'wb') as staged:
+                for block in iter(lambda: stream.read(1 << 20), b''):
+                    size += len(block)
+                    if max_bytes is not None and size > max_bytes:
+                        raise UploadTooLargeError(f'Arquivo maior que o limite de {max_bytes} bytes')
+                    digest.update(block)
+                    staged.write(block)
+        except Exception:
+            os.unlink(path)
+            raise
+        return path, digest.hexdigest(), size
+
+    def submit(self, stream, filename, current_user=None, batch=None, replaces=None, max_bytes=None):
+        """
+        Grava o upload em disco e enfileira o job
+        Com replaces, o documento informado é removido quando o novo estiver gravado
+        Com max_bytes, conteúdos maiores são rejeitados com UploadTooLargeError
+        Retorna (id do job, True) ou (id do job existente, False) se o conteúdo já é conhecido;
+        (None, False) se não foi possível registrá-lo
+        """
+        path, file_hash, file_size = self._stage(stream, max_bytes)
+
+        # Uploads sem autenticação são registrados com uploaded_by = 0
+        job_id, created = self.db_manager.create_ingestion_job(
+            os.path.basename(path),
+            filename,
+            file_size,
+            file_hash,
+            current_user['id'] if current_user else 0,
+            owner=self._owner_id(),
+            staging_dir=self.staging_dir,
+            stale_seconds=self.stale_seconds
+        )
+        if not created:
+            os.unlink(path)
+            if job_id is not None:
+                logger.info(f"Upload de {filename} é duplicata do job {job_id}, ignorado")
+            return job_id, False
+
+        if batch is not None:
+            batch.add()
+        self.executor.submit(self._run, job_id, path, file_hash, file_size, filename, current_user, batch, replaces)
+        logger.info(f"Job de ingestão {job_id} enfileirado: {filename}")
+        return job_id, True
+
+    def close_batch(self, batch):
+        """Encerra um lote: os documentos já gravados e ainda não indexados são indexados em segundo plano"""
+        ready = batch.close()
+        if ready:
+            self.executor.submit(self._index_jobs, ready)
+
+    def _index_jobs(self, job_ids):
+        """Atualiza os índices de busca uma vez para todos os jobs já gravados no armazenamento"""
+        if not job_ids:
+            return
+        try:
+            self.index()
+        except Exception as e:
+            logger.error(f"Erro ao indexar os jobs {job_ids}: {e}")
+            for job_id in job_ids:
+                self.db_manager.update_ingestion_job(
+                    job_id, status='failed', error_message=f'Erro ao indexar: {str(e)}')
+            return
+        for job_id in job_ids:
+            self.db_manager.update_ingestion_job(job_id, status='done')
+        logger.info(f"Jobs de ingestão concluídos: {job_ids}")
+
+    def _previous_version(self, doc_id):
+        """
+        Tamanho e hash de cada página, chunks (em caracteres) e hash do arquivo de um documento,
+        se as páginas estão no cache; as páginas são lidas uma a uma, sem montar o texto inteiro
+        """
+        if self.extraction_cache is None or self.store is None:
+            return None
+        previous = self.db_manager.get_document_by_store_id(doc_id)
+        if not previous or previous['file_hash'] not in self.extraction_cache:
+            return None
+        old_hashes = self.extraction_cache.page_hashes(previous['file_hash'])
+        if old_hashes is None:
+            return None
+
+        # Os chunks só podem ser mantidos se o texto armazenado é exatamente o das páginas do cache
+        document = self.store.documents[doc_id]
+        position = document.offset
+        page_lengths = []
+        for text in self.extraction_cache.iter_pages(previous['file_hash']):
+            encoded = len(text.encode('utf-8'))
+            if position + encoded > document.offset + document.length or \
+                    self.store.read_text(position, position + encoded) != text:
+                return None
+            position += encoded
+            page_lengths.append(len(text))
+        if len(page_lengths) != len(old_hashes) or position != document.offset + document.length:
+            return None
+        return page_lengths, old_hashes, self.store.chunk_spans(doc_id), previous['file_hash']
+
+    def _plan(self, path, file_hash, replaces):
+        """
+        Hashes das páginas do upload e, para uma nova versão, as páginas inalteradas (página →
+        página da versão anterior, alinhadas por match_pages), o hash do arquivo anterior e o
+        divisor que mantém os chunks delas
+        """
+        if self.extraction_cache is None:
+            return None, {}, None, None
+        page_hashes = self.extraction_cache.page_hashes(file_hash)
+        if page_hashes is None:
+            with open(path, 'rb') as stream:
+                page_hashes = pdf_page_hashes(stream)
+            # Entrada já extraída com hashes de outro formato: atualiza para as próximas versões
+            if file_hash in self.extraction_cache:
+                self.extraction_cache.record_page_hashes(file_hash, page_hashes)
+
+        previous = self._previous_version(replaces) if replaces is not None else None
+        if previous is None:
+            return page_hashes, {}, None, None
+
+        old_page_lengths, old_hashes, old_spans, old_file_hash = previous
+        reused = match_pages(old_hashes, page_hashes)
+        splitter = IncrementalSplitter(old_page_lengths, old_spans, reused, self.make_splitter)
+        logger.info(f"Nova versão do documento {replaces}: {len(reused)} de {len(page_hashes)} páginas inalteradas")
+        return page_hashes, reused, old_file_hash, splitter
+
+    def _pages(self, path, file_hash, page_hashes=None, reused=None, old_file_hash=None):
+        """
+        Páginas do cache de extração, se o conteúdo já foi extraído; senão, do PDF (gravando no cache),
+        extraindo apenas as páginas que não estão em reused, cujo texto vem da entrada old_file_hash
+        """
+        if self.extraction_cache is not None and file_hash in self.extraction_cache:
+            logger.info(f"Texto de {file_hash[:12]} reaproveitado do cache de extração")
+            yield from self.extraction_cache.iter_pages(file_hash)
+            return
+
+        with open(path, 'rb') as stream:
+            if reused:
+                missing = [number for number in range(len(page_hashes)) if number not in reused]
+                pages = merge_pages(len(page_hashes), reused, self.extract_pages(stream, missing),
+                                    self.extraction_cache.iter_pages(old_file_hash))
+            else:
+                pages = self.extract_pages(stream)
+            if self.extraction_cache is not None:
+                pages = self.extraction_cache.record(file_hash, pages, page_hashes)
+            yield from pages
+
+    def _run(self, job_id, path, file_hash, file_size, filename, current_user, batch=None, replaces=None):
+        last_update = 0.0
+        pages_done = 0
+
+        def progress(pages_processed, chunk_count):
+            # O progresso é gravado no banco no máximo uma vez por progress_interval
+            nonlocal last_update, pages_done
+            pages_done = pages_processed
+            now = time.monotonic()
+            if now - last_update >= self.progress_interval:
+                last_update = now
+                self.db_manager.update_ingestion_job(
+                    job_id, pages_processed=pages_processed, chunk_count=chunk_count)
+
+        stored = False
+        if not self.db_manager.claim_ingestion_job(job_id):
+            # Dado como interrompido enquanto esperava na fila: o conteúdo pode já ter sido reenviado
+            logger.warning(f"Job de ingestão {job_id} não está mais na fila, ignorado")
+            os.unlink(path)
+            if batch is not None:
+                self._index_jobs(batch.finish())
+            return
+        try:
+            page_hashes, reused, old_file_hash, splitter = self._plan(path, file_hash, replaces)
+            with closing(self._pages(path, file_hash, page_hashes, reused, old_file_hash)) as pages:
+                doc_id, chunk_count = self.ingest(pages, filename, current_user, progress, splitter,
+                                                  file_size, file_hash)
+            if splitter is not None:
+                logger.info(f"Documento {doc_id}: {splitter.kept_count} de {chunk_count} chunks mantidos da versão anterior")
+            self.db_manager.update_ingestion_job(
+                job_id, status='indexing', pages_processed=pages_done, chunk_count=chunk_count,
+                store_doc_id=doc_id)
+            stored = True
+            if replaces is not None:
+                self.remove(replaces)
+                logger.info(f"Documento {replaces} substituído pelo documento {doc_id}")
+            logger.info(f"Job de ingestão {job_id} gravado: {filename} ({chunk_count} chunks)")
+        except EmptyDocumentError as e:
+            self.db_manager.update_ingestion_job(job_id, status='failed', error_message=str(e))
+        except Exception as e:
+            logger.error(f"Erro no job de ingestão {job_id}: {e}")
+            self.db_manager.update_ingestion_job(
+                job_id, status='failed', error_message=f'Erro ao processar PDF: {str(e)}')
+        finally:
+            os.unlink(path)
+
+        if batch is None:
+            self._index_jobs([job_id] if stored else [])
+        else:
+            self._index_jobs(batch.finish(job_id if stored else None))
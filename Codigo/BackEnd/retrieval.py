@@ -0,0 +1,54 @@
+# retrieval.py - Recuperação híbrida com fusão por rank recíproco (RRF)
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+class HybridRetriever:
+    """
+    Executa vários recuperadores em paralelo (léxico, vetorial, ...) e funde os rankings por RRF
+    Cada requisição tem um orçamento de candidatos (dividido entre os recuperadores) e de latência:
+    recuperadores que não respondem a tempo são ignorados, exceto o primário (o primeiro registrado)
+    """
+
+    def __init__(self, retrievers, rrf_k=60, max_workers=8):
+        # retrievers: nome → função(pergunta, max_candidatos) que retorna [(chunk_id, score)] ordenados
+        self.retrievers = dict(retrievers)
+        self.primary = next(iter(self.retrievers))
+        self.rrf_k = rrf_k
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='retrieval')
+
+    def retrieve(self, query, max_results=3, candidate_budget=20, time_budget_ms=300):
+        """
+        Retorna [(chunk_id, score_rrf, {recuperador: posição})] com os max_results melhores
+        """
+        started = time.perf_counter()
+        per_retriever = max(max_results, candidate_budget // len(self.retrievers))
+        futures = {
+            name: self.executor.submit(retriever, query, per_retriever)
+            for name, retriever in self.retrievers.items()
+        }
+        wait(futures.values(), timeout=time_budget_ms / 1000)
+
+        rankings = {}
+        for name, future in futures.items():
+            if name != self.primary and not future.done():
+                logger.warning(f"Recuperador '{name}' excedeu o orçamento de {time_budget_ms} ms")
+                continue
+            try:
+                rankings[name] = future.result()
+            except Exception as e:
+                logger.error(f"Erro no recuperador '{name}': {e}")
+
+        fused = {}
+        ranks = {}
+        for name, hits in rankings.items():
+            for rank, (chunk_id, _) in enumerate(hits, start=1):
+                fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (self.rrf_k + rank)
+                ranks.setdefault(chunk_id, {})[name] = rank
+
+        ranked = sorted(fused.items(), key=lambda item: (-item[1], item[0]))[:max_results]
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        logger.debug(f"Recuperação híbrida: {len(fused)} candidatos em {elapsed_ms:.1f} ms")
+        return [(chunk_id, score, ranks[chunk_id]) for chunk_id, score in ranked]
@@ -0,0 +1,565 @@
+# search_index.py - Índice invertido para a busca de documentos
+import math
+import heapq
+import threading
+import logging
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from text_analysis import parse_query
+
+logger = logging.getLogger(__name__)
+
+class PostingList:
+    """
+    Lista de ocorrências de um termo: ids dos chunks e frequências, em ordem crescente de id
+    As posições do termo em cada chunk ficam concatenadas em um único array: as do i-ésimo chunk
+    são positions[starts[i]:starts[i] + tfs[i]]
+    Guarda também o limite superior do score do termo e as estatísticas para as quais foi calculado
+    """
+    __slots__ = ('ids', 'tfs', 'starts', 'positions', 'bound_key', 'upper_bound')
+
+    def __init__(self):
+        self.ids = []
+        self.tfs = []
+        self.starts = array('I')
+        self.positions = array('I')
+        self.bound_key = None
+        self.upper_bound = 0.0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def find(self, chunk_id):
+        """Índice do chunk na lista, ou None se o termo não ocorre nele"""
+        index = bisect_left(self.ids, chunk_id)
+        if index < len(self.ids) and self.ids[index] == chunk_id:
+            return index
+        return None
+
+    def positions_at(self, index):
+        start = self.starts[index]
+        return self.positions[start:start + self.tfs[index]]
+
+class PostingMap:
+    """
+    Listas de ocorrências por termo: as de um segmento persistido (ver index_snapshot.IndexSegment),
+    lidas sob demanda do mmap, sobrepostas pelas listas mantidas em memória
+    Uma lista do segmento só é copiada para a memória quando o termo muda (mutable(), del);
+    as consultadas ficam em um cache LRU limitado, que preserva os limites superiores calculados
+    """
+
+    def __init__(self, segment=None, cache_size=4096):
+        self.segment = segment
+        self.cache_size = cache_size
+        self._memory = {}
+        self._removed = set()
+        self._cache = OrderedDict()
+
+    def get(self, term, default=None):
+        postings = self._memory.get(term)
+        if postings is not None:
+            return postings
+        if self.segment is None or term in self._removed:
+            return default
+        postings = self._cache.get(term)
+        if postings is not None:
+            self._cache.move_to_end(term)
+            return postings
+        postings = self.segment.postings(term)
+        if postings is None:
+            return default
+        self._cache[term] = postings
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return postings
+
+    def __getitem__(self, term):
+        postings = self.get(term)
+        if postings is None:
+            raise KeyError(term)
+        return postings
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def mutable(self, term):
+        """Lista do termo em memória, criada (vazia ou como cópia da lista do segmento) se preciso"""
+        postings = self._memory.get(term)
+        if postings is None:
+            frozen = self.get(term)
+            postings = self._memory[term] = PostingList()
+            if frozen is not None:
+                postings.ids = list(frozen.ids)
+                postings.tfs = list(frozen.tfs)
+                postings.starts = array('I', frozen.starts)
+                postings.positions = array('I', frozen.positions)
+            self._cache.pop(term, None)
+        return postings
+
+    def __delitem__(self, term):
+        self._memory.pop(term, None)
+        self._cache.pop(term, None)
+        if self.segment is not None:
+            self._removed.add(term)
+
+    def terms(self):
+        """Todos os termos com lista de ocorrências"""
+        terms = set(self._memory)
+        if self.segment is not None:
+            terms.update(term for term in self.segment.terms() if term not in self._removed)
+        return terms
+
+    @property
+    def memory_terms(self):
+        """Quantidade de listas mantidas em memória (fora do segmento)"""
+        return len(self._memory)
+
+def _min_gap_error(positions, other_positions, gap):
+    """
+    Menor |q - p - gap| entre posições p do primeiro termo e q do segundo (ambas em ordem crescente)
+    0 significa os dois termos exatamente à distância em que aparecem na consulta
+    """
+    best = None
+    i = j = 0
+    while i < len(positions) and j < len(other_positions):
+        difference = other_positions[j] - positions[i] - gap
+        if best is None or abs(difference) < best:
+            best = abs(difference)
+            if not best:
+                break
+        if difference < 0:
+            j += 1
+        else:
+            i += 1
+    return best
+
+class _TermCursor:
+    """Cursor sobre uma lista de ocorrências durante o processamento da consulta"""
+    __slots__ = ('ids', 'tfs', 'idf', 'upper_bound', 'position')
+
+    def __init__(self, postings, idf, upper_bound):
+        self.ids = postings.ids
+        self.tfs = postings.tfs
+        self.idf = idf
+        self.upper_bound = upper_bound
+        self.position = 0
+
+    def current(self):
+        return self.ids[self.position] if self.position < len(self.ids) else None
+
+    def seek(self, chunk_id):
+        """Avança até o primeiro chunk com id >= chunk_id"""
+        self.position = bisect_left(self.ids, chunk_id, self.position)
+        return self.current()
+
+class InvertedIndex:
+    """
+    Índice invertido termo → lista de chunks com frequência do termo
+    Mantém as estatísticas do corpus (df, tamanho dos chunks, tamanho médio) para ranking BM25
+    Construído de forma incremental a cada upload, evita percorrer todos os chunks a cada pergunta
+    Chunks removidos recebem uma marca (tombstone): deixam de ser pontuados e de contar nas
+    estatísticas imediatamente, e suas ocorrências são retiradas das listas por compact()
+    As posições dos termos permitem buscar frases entre aspas e favorecer chunks em que os termos
+    da pergunta aparecem próximos, sem reler o texto dos chunks
+    O índice pode partir de um segmento persistido (load_segment), mapeado em memória e
+    compartilhado entre os processos; só as alterações posteriores ocupam memória do processo
+    """
+
+    def __init__(self, k1=1.2, b=0.75, proximity_window=5, proximity_weight=1.0, proximity_candidates=4):
+        self.k1 = k1
+        self.b = b
+        # Bônus de proximidade: pares de termos consecutivos da consulta a menos de proximity_window
+        # posições do esperado somam até proximity_weight × idf; reordena os proximity_candidates × k melhores
+        self.proximity_window = proximity_window
+        self.proximity_weight = proximity_weight
+        self.proximity_candidates = proximity_candidates
+        self.postings = PostingMap()
+        # Tamanho (em termos) de cada chunk, indexado pelo id do chunk
+        self.lengths = array('i')
+        self.total_length = 0
+        # Chunks removidos (ainda presentes nas listas) e, por termo, quantas ocorrências são deles
+        self.tombstones = set()
+        self.num_deleted = 0
+        self._dead_postings = {}
+        self._terms_to_compact = set()
+        # Incrementada a cada alteração; invalida os limites superiores calculados
+        self.version = 0
+        self._lock = threading.Lock()
+
+    @property
+    def num_chunks(self):
+        return len(self.lengths) - self.num_deleted
+
+    @property
+    def avg_length(self):
+        return self.total_length / self.num_chunks if self.num_chunks else 0.0
+
+    def _df(self, term):
+        return len(self.postings.get(term, ())) - self._dead_postings.get(term, 0)
+
+    def add(self, chunk_id, tokens, positions=None):
+        """
+        Indexa um novo chunk a partir dos seus termos já analisados e de suas posições
+        (ver analyze_positions; sem elas, vale a ordem dos termos)
+        Ids devem ser crescentes, na ordem do document_store
+        """
+        if positions is None:
+            positions = range(len(tokens))
+        occurrences = {}
+        for term, position in zip(tokens, positions):
+            occurrences.setdefault(term, []).append(position)
+        length = len(tokens)
+
+        with self._lock:
+            for term, term_positions in occurrences.items():
+                postings = self.postings.mutable(term)
+                postings.ids.append(chunk_id)
+                postings.tfs.append(len(term_positions))
+                postings.starts.append(len(postings.positions))
+                postings.positions.extend(term_positions)
+            self.lengths.append(length)
+            self.total_length += length
+            self.version += 1
+
+    def delete(self, chunk_id, tokens):
+        """
+        Marca um chunk como removido a partir dos seus termos já analisados
+        As estatísticas passam a desconsiderá-lo na hora; as listas são compactadas depois
+        """
+        terms = set(tokens)
+        with self._lock:
+            # Tamanho negativo identifica os chunks já compactados
+            if chunk_id in self.tombstones or chunk_id >= len(self.lengths) or self.lengths[chunk_id] < 0:
+                return
+            self.tombstones.add(chunk_id)
+            self.num_deleted += 1
+            self.total_length -= self.lengths[chunk_id]
+            for term in terms:
+                self._dead_postings[term] = self._dead_postings.get(term, 0) + 1
+            self._terms_to_compact |= terms
+            self.version += 1
+
+    def compact(self):
+        """
+        Retira das listas de ocorrências os chunks removidos
+        Percorre apenas os termos dos chunks removidos, uma lista por vez, sem bloquear as consultas
+        por mais que a cópia de uma lista; retorna a quantidade de chunks compactados
+        """
+        with self._lock:
+            terms, self._terms_to_compact = self._terms_to_compact, set()
+            compacted = set(self.tombstones)
+
+        for term in terms:
+            with self._lock:
+                if term not in self.postings:
+                    continue
+                postings = self.postings.mutable(term)
+                tombstones = self.tombstones
+                kept = [index for index, chunk_id in enumerate(postings.ids) if chunk_id not in tombstones]
+                if kept:
+                    starts = array('I')
+                    positions = array('I')
+                    for index in kept:
+                        starts.append(len(positions))
+                        positions.extend(postings.positions_at(index))
+                    postings.ids = [postings.ids[index] for index in kept]
+                    postings.tfs = [postings.tfs[index] for index in kept]
+                    postings.starts = starts
+                    postings.positions = positions
+                    postings.bound_key = None
+                else:
+                    del self.postings[term]
+                self._dead_postings.pop(term, None)
+
+        with self._lock:
+            for chunk_id in compacted:
+                self.lengths[chunk_id] = -1
+            self.tombstones -= compacted
+            self.version += 1
+        return len(compacted)
+
+    def load_segment(self, segment):
+        """
+        Passa a usar um segmento persistido (ver index_snapshot) com todos os chunks já indexados:
+        as listas em memória são descartadas e as do segmento são lidas sob demanda do mmap
+        """
+        with self._lock:
+            self.postings = PostingMap(segment)
+            self.lengths = array('i', segment.lengths)
+            self.total_length = segment.total_length
+            self.num_deleted = segment.num_deleted
+            self.tombstones = set()
+            self._dead_postings = {}
+            self._terms_to_compact = set()
+            self.version += 1
+
+    def live_postings(self):
+        """
+        (termo, ids, frequências, posições por chunk) de cada termo, sem os chunks removidos, em
+        ordem crescente do termo codificado em UTF-8; cada lista é lida com a trava apenas pelo tempo
+        da cópia. Usado para gravar um segmento (ver index_snapshot.write_segment)
+        """
+        with self._lock:
+            terms = sorted(self.postings.terms(), key=lambda term: term.encode('utf-8'))
+        for term in terms:
+            with self._lock:
+                postings = self.postings.get(term)
+                if postings is None:
+                    continue
+                tombstones = self.tombstones
+                kept = [index for index, chunk_id in enumerate(postings.ids) if chunk_id not in tombstones]
+                entry = (term, [postings.ids[index] for index in kept], [postings.tfs[index] for index in kept],
+                         [postings.positions_at(index) for index in kept])
+            if entry[1]:
+                yield entry
+
+    def chunk_lengths(self):
+        """Tamanho de cada chunk, -1 para os removidos"""
+        with self._lock:
+            lengths = array('i', self.lengths)
+            for chunk_id in self.tombstones:
+                lengths[chunk_id] = -1
+            return lengths
+
+    def idf(self, term, num_chunks=None, df=None):
+        """IDF do BM25 (variante sempre positiva usada pelo Lucene)"""
+        if num_chunks is None:
+            num_chunks = self.num_chunks
+        if df is None:
+            df = self._df(term)
+        return math.log(1 + (num_chunks - df + 0.5) / (df + 0.5))
+
+    def term_stats(self, terms):
+        """Estatísticas locais (chunks, tamanho total, df por termo) para compor as globais de vários shards"""
+        with self._lock:
+            return self.num_chunks, self.total_length, [self._df(term) for term in terms]
+
+    def _term_score(self, idf, tf, length, avg_length):
+        norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+        return idf * tf * (self.k1 + 1) / (tf + norm)
+
+    def _upper_bound(self, postings, idf, avg_length):
+        """
+        Maior contribuição possível do termo para o score de um chunk
+        Recalculado apenas quando o índice ou as estatísticas mudam (uploads são raros, consultas não)
+        """
+        bound_key = (self.version, idf, avg_length)
+        if postings.bound_key != bound_key:
+            lengths = self.lengths
+            postings.upper_bound = max(
+                self._term_score(idf, tf, lengths[chunk_id], avg_length)
+                for chunk_id, tf in zip(postings.ids, postings.tfs)
+            )
+            postings.bound_key = bound_key
+        return postings.upper_bound
+
+    def search(self, query, max_results=3, min_score_ratio=0.0):
+        """
+        Ranking BM25 top-k com poda dinâmica (MaxScore) e bônus de proximidade
+        Cada termo tem um limite superior de contribuição; chunks que só aparecem em termos cujos
+        limites somados não alcançam o k-ésimo score atual são pulados.
+        Trechos entre aspas restringem o resultado aos chunks que contêm a frase; se nenhum contém,
+        a consulta é respondida sem a restrição.
+        Descarta resultados com score abaixo de min_score_ratio × melhor score
+        """
+        terms, positions, phrases = parse_query(query)
+        if phrases:
+            ranked = self.search_query(terms, positions, phrases, max_results, min_score_ratio)
+            if ranked:
+                return ranked
+        return self.search_query(terms, positions, (), max_results, min_score_ratio)
+
+    def search_query(self, terms, positions, phrases=(), max_results=3, min_score_ratio=0.0,
+                     collection_stats=None):
+        """
+        Ranking posicional de uma consulta já analisada (ver parse_query)
+        Com frases, apenas os chunks que contêm todas elas são pontuados (interseção das listas e
+        conferência das posições); sem frases, os melhores candidatos do BM25 são reordenados.
+        Em ambos os casos soma-se o bônus de proximidade dos termos da consulta
+        """
+        unique_terms = sorted(set(terms))
+        if not unique_terms or max_results <= 0:
+            return []
+        sequence = list(zip(terms, positions))
+
+        if phrases:
+            with self._lock:
+                num_chunks, avg_length, idfs = self._query_stats(unique_terms, collection_stats)
+                ranked = [(chunk_id, self._score(chunk_id, idfs, avg_length) + self._proximity(chunk_id, sequence, idfs))
+                          for chunk_id in self._phrase_candidates(phrases)]
+        else:
+            ranked = self.search_terms(unique_terms, max_results * self.proximity_candidates, 0.0, collection_stats)
+            if len(unique_terms) > 1 and ranked:
+                with self._lock:
+                    _, _, idfs = self._query_stats(unique_terms, collection_stats)
+                    ranked = [(chunk_id, score + self._proximity(chunk_id, sequence, idfs))
+                              for chunk_id, score in ranked if chunk_id not in self.tombstones]
+
+        # Score decrescente; empates mantêm a ordem de inserção dos chunks
+        ranked.sort(key=lambda item: (-item[1], item[0]))
+        ranked = ranked[:max_results]
+        if ranked and min_score_ratio > 0:
+            threshold = ranked[0][1] * min_score_ratio
+            ranked = [item for item in ranked if item[1] >= threshold]
+        return ranked
+
+    def _query_stats(self, terms, collection_stats):
+        """(chunks, tamanho médio, {termo: idf}) locais ou globais (shards)"""
+        if collection_stats is None:
+            num_chunks, avg_length, dfs = self.num_chunks, self.avg_length, {}
+        else:
+            num_chunks, avg_length, dfs = collection_stats
+        idfs = {term: self.idf(term, num_chunks, dfs.get(term)) for term in terms if term in self.postings}
+        return num_chunks, avg_length, idfs
+
+    def _score(self, chunk_id, idfs, avg_length):
+        """Score BM25 de um chunk específico, localizando-o por busca binária em cada lista"""
+        length = self.lengths[chunk_id]
+        score = 0.0
+        for term, idf in idfs.items():
+            postings = self.postings[term]
+            index = postings.find(chunk_id)
+            if index is not None:
+                score += self._term_score(idf, postings.tfs[index], length, avg_length)
+        return score
+
+    def _phrase_candidates(self, phrases):
+        """Chunks (não removidos) que contêm todas as frases, em ordem crescente de id"""
+        terms = {term for phrase in phrases for term, _ in phrase}
+        lists = [self.postings.get(term) for term in terms]
+        if not all(lists):
+            return []
+        # Percorre a lista mais curta e procura cada id nas demais, sempre adiante
+        lists.sort(key=len)
+        cursors = [0] * len(lists)
+        candidates = []
+        for chunk_id in lists[0].ids:
+            if chunk_id in self.tombstones:
+                continue
+            for position, postings in enumerate(lists[1:], start=1):
+                cursors[position] = bisect_left(postings.ids, chunk_id, cursors[position])
+                if cursors[position] == len(postings.ids) or postings.ids[cursors[position]] != chunk_id:
+                    break
+            else:
+                if all(self._contains_phrase(chunk_id, phrase) for phrase in phrases):
+                    candidates.append(chunk_id)
+        return candidates
+
+    def _contains_phrase(self, chunk_id, phrase):
+        """Confere nas posições se os termos da frase aparecem nos deslocamentos esperados"""
+        first_term, first_offset = phrase[0]
+        first = self.postings[first_term]
+        others = []
+        for term, offset in phrase[1:]:
+            postings = self.postings[term]
+            others.append((set(postings.positions_at(postings.find(chunk_id))), offset - first_offset))
+        return any(all(start + offset in positions for positions, offset in others)
+                   for start in first.positions_at(first.find(chunk_id)))
+
+    def _proximity(self, chunk_id, sequence, idfs):
+        """
+        Bônus para pares de termos consecutivos da consulta que aparecem no chunk à mesma distância
+        (ou quase) que na pergunta: proximity_weight × menor idf do par, decrescendo com o desvio
+        """
+        if self.proximity_weight <= 0:
+            return 0.0
+        bonus = 0.0
+        for (term, position), (next_term, next_position) in zip(sequence, sequence[1:]):
+            if term == next_term or term not in idfs or next_term not in idfs:
+                continue
+            postings, next_postings = self.postings[term], self.postings[next_term]
+            index, next_index = postings.find(chunk_id), next_postings.find(chunk_id)
+            if index is None or next_index is None:
+                continue
+            error = _min_gap_error(postings.positions_at(index), next_postings.positions_at(next_index),
+                                   next_position - position)
+            if error < self.proximity_window:
+                bonus += min(idfs[term], idfs[next_term]) * (1 - error / self.proximity_window)
+        return bonus * self.proximity_weight
+
+    def search_terms(self, terms, max_results=3, min_score_ratio=0.0, collection_stats=None):
+        """
+        Ranking de termos já analisados
+        collection_stats: (chunks, tamanho médio, {termo: df}) globais, quando o índice é um shard do corpus
+        """
+        with self._lock:
+            if not self.num_chunks or max_results <= 0:
+                return []
+            if collection_stats is None:
+                num_chunks, avg_length, dfs = self.num_chunks, self.avg_length, {}
+            else:
+                num_chunks, avg_length, dfs = collection_stats
+            lengths = self.lengths
+            tombstones = self.tombstones
+
+            cursors = []
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = self.idf(term, num_chunks, dfs.get(term))
+                cursors.append(_TermCursor(postings, idf, self._upper_bound(postings, idf, avg_length)))
+
+            # Termos em ordem crescente de limite superior; prefix_bounds[i] = soma dos limites de 0..i
+            cursors.sort(key=lambda cursor: cursor.upper_bound)
+            prefix_bounds = []
+            total = 0.0
+            for cursor in cursors:
+                total += cursor.upper_bound
+                prefix_bounds.append(total)
+
+            # Heap mínimo de (score, -chunk_id): o topo é o pior resultado do top-k atual
+            heap = []
+            threshold = 0.0
+            # Termos com índice < essential_start são "não essenciais": sozinhos não entram no top-k
+            essential_start = 0
+
+            while True:
+                candidates = [cursor.current() for cursor in cursors[essential_start:]]
+                candidates = [chunk_id for chunk_id in candidates if chunk_id is not None]
+                if not candidates:
+                    break
+                chunk_id = min(candidates)
+                length = lengths[chunk_id]
+
+                # Chunks removidos ainda presentes nas listas são pulados sem pontuação
+                if chunk_id in tombstones:
+                    for cursor in cursors[essential_start:]:
+                        if cursor.current() == chunk_id:
+                            cursor.position += 1
+                    continue
+
+                score = 0.0
+                for cursor in cursors[essential_start:]:
+                    if cursor.current() == chunk_id:
+                        score += self._term_score(cursor.idf, cursor.tfs[cursor.position], length, avg_length)
+                        cursor.position += 1
+
+                # Completa o score com os termos não essenciais, parando quando não há chance de entrar
+                for index in range(essential_start - 1, -1, -1):
+                    if len(heap) == max_results and score + prefix_bounds[index] < threshold:
+                        break
+                    cursor = cursors[index]
+                    if cursor.seek(chunk_id) == chunk_id:
+                        score += self._term_score(cursor.idf, cursor.tfs[cursor.position], length, avg_length)
+
+                entry = (score, -chunk_id)
+                if len(heap) < max_results:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+                else:
+                    continue
+
+                if len(heap) == max_results:
+                    threshold = heap[0][0]
+                    while essential_start < len(cursors) and prefix_bounds[essential_start] < threshold:
+                        essential_start += 1
+
+        # Score decrescente; empates mantêm a ordem de inserção dos chunks
+        ranked = sorted(((-neg_id, score) for score, neg_id in heap), key=lambda item: (-item[1], item[0]))
+        if ranked and min_score_ratio > 0:
+            threshold = ranked[0][1] * min_score_ratio
+            ranked = [item for item in ranked if item[1] >= threshold]
+        return ranked
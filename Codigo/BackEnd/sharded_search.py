@@ -0,0 +1,194 @@
+# sharded_search.py - Busca particionada em shards, com scatter-gather sobre processos
+import os
+import atexit
+import threading
+import logging
+import multiprocessing
+from text_analysis import analyze, analyze_positions, parse_query
+
+logger = logging.getLogger(__name__)
+
+def _shard_main(connection, data_dir, shard_id, num_shards):
+    """
+    Processo dono de um shard: indexa os chunks com chunk_id % num_shards == shard_id
+    lendo o armazenamento compartilhado (mmap) e responde às requisições do coordenador
+    Ids locais são chunk_id // num_shards, mantendo o índice denso
+    Documentos removidos recebem tombstones e as listas do shard são compactadas no próprio processo
+    """
+    from chunk_store import ChunkStore
+    from search_index import InvertedIndex
+
+    store = ChunkStore(data_dir)
+    index = InvertedIndex()
+    next_chunk_id = shard_id
+    applied_deletions = 0
+
+    def catch_up():
+        nonlocal next_chunk_id, applied_deletions
+        store.refresh()
+        while next_chunk_id < len(store):
+            index.add(next_chunk_id // num_shards, *analyze_positions(store[next_chunk_id]['content']))
+            next_chunk_id += num_shards
+
+        if applied_deletions < len(store.deleted_documents):
+            for doc_id in store.deleted_documents[applied_deletions:]:
+                for chunk_id in store.chunk_range(doc_id):
+                    if chunk_id % num_shards == shard_id:
+                        index.delete(chunk_id // num_shards, analyze(store[chunk_id]['content']))
+            applied_deletions = len(store.deleted_documents)
+            index.compact()
+
+    # Os shards reconstroem suas partes do índice em paralelo na inicialização
+    catch_up()
+
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+
+        try:
+            kind = request[0]
+            if kind == 'stats':
+                # Incorpora os chunks acrescentados por qualquer processo no início de cada consulta
+                catch_up()
+                connection.send(index.term_stats(request[1]))
+            elif kind == 'search':
+                _, terms, positions, phrases, collection_stats, max_results = request
+                hits = index.search_query(terms, positions, phrases, max_results, collection_stats=collection_stats)
+                connection.send([(local_id * num_shards + shard_id, score) for local_id, score in hits])
+        except Exception as e:
+            connection.send(e)
+
+    connection.close()
+
+class ShardedSearcher:
+    """
+    Índice léxico particionado em N shards, cada um mantido por um processo próprio
+    Uma consulta é enviada a todos os shards (scatter); cada um devolve seu top-k local, que o
+    coordenador une (gather). As estatísticas do BM25 (df, tamanho médio) são somadas entre os
+    shards antes da pontuação, de modo que o ranking é o mesmo do índice único.
+    Como cada shard roda em um processo, a pontuação escala com os núcleos disponíveis (sem GIL).
+    """
+
+    def __init__(self, data_dir, num_shards):
+        self.data_dir = data_dir
+        self.num_shards = num_shards
+        self._connections = []
+        self._processes = []
+        self._pid = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        """
+        Inicia os processos dos shards na primeira consulta de cada processo (chamado com _lock)
+        O app é importado por cada worker do gunicorn (ou uma vez no master, com --preload): os shards
+        pertencem ao worker que os iniciou, e um worker criado por fork não usa os pipes herdados
+        """
+        if self._pid == os.getpid() and self._processes:
+            return
+        self._connections = []
+        self._processes = []
+        self._pid = os.getpid()
+        # fork evita reimportar o app nos shards (spawn executaria de novo o módulo principal);
+        # o processo filho executa apenas _shard_main, que cria as próprias travas. Sem fork (Windows), usa spawn
+        start_method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        context = multiprocessing.get_context(start_method)
+        for shard_id in range(self.num_shards):
+            parent_connection, child_connection = context.Pipe()
+            process = context.Process(
+                target=_shard_main,
+                args=(child_connection, self.data_dir, shard_id, self.num_shards),
+                name=f'search-shard-{shard_id}',
+                daemon=True
+            )
+            process.start()
+            child_connection.close()
+            self._connections.append(parent_connection)
+            self._processes.append(process)
+        logger.info(f"Busca particionada iniciada com {self.num_shards} shards")
+
+    def _scatter_gather(self, request):
+        """
+        Envia a requisição a todos os shards e lê uma resposta de cada (chamado com _lock)
+        Se um shard morreu (EOFError, pipe quebrado), as respostas dos demais ficariam nos pipes e
+        seriam lidas pela consulta seguinte: todos os shards são encerrados antes de propagar o erro,
+        e a próxima consulta os inicia de novo
+        """
+        self._ensure_started()
+        try:
+            for connection in self._connections:
+                connection.send(request)
+            responses = [connection.recv() for connection in self._connections]
+        except (EOFError, OSError) as e:
+            logger.error(f"Shard de busca indisponível ({e!r}); reiniciando os {self.num_shards} shards")
+            self._stop()
+            raise
+        for response in responses:
+            if isinstance(response, Exception):
+                raise response
+        return responses
+
+    def search(self, query, max_results=3, min_score_ratio=0.0):
+        """
+        Mesma interface do InvertedIndex: [(chunk_id, score)] em ordem decrescente de score
+        Frases entre aspas são conferidas em cada shard; se nenhum shard tem a frase, a consulta
+        é repetida sem a restrição, como no índice único
+        """
+        query_terms, positions, phrases = parse_query(query)
+        terms = sorted(set(query_terms))
+        if not terms or max_results <= 0:
+            return []
+
+        with self._lock:
+            # Fase 1: estatísticas globais dos termos da consulta
+            num_chunks = total_length = 0
+            dfs = [0] * len(terms)
+            for shard_chunks, shard_length, shard_dfs in self._scatter_gather(('stats', terms)):
+                num_chunks += shard_chunks
+                total_length += shard_length
+                dfs = [df + shard_df for df, shard_df in zip(dfs, shard_dfs)]
+            if not num_chunks:
+                return []
+            collection_stats = (num_chunks, total_length / num_chunks, dict(zip(terms, dfs)))
+
+            # Fase 2: top-k local de cada shard com as estatísticas globais
+            for query_phrases in ([phrases, []] if phrases else [[]]):
+                responses = self._scatter_gather(
+                    ('search', query_terms, positions, query_phrases, collection_stats, max_results))
+                hits = [hit for shard_hits in responses for hit in shard_hits]
+                if hits:
+                    break
+
+        ranked = sorted(hits, key=lambda item: (-item[1], item[0]))[:max_results]
+        if ranked and min_score_ratio > 0:
+            threshold = ranked[0][1] * min_score_ratio
+            ranked = [item for item in ranked if item[1] >= threshold]
+        return ranked
+
+    def _stop(self):
+        """Encerra imediatamente os processos dos shards, descartando respostas pendentes"""
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join(timeout=1)
+        for connection in self._connections:
+            connection.close()
+        self._connections = []
+        self._processes = []
+
+    def close(self):
+        """Encerra os processos dos shards iniciados por este processo"""
+        if self._pid != os.getpid():
+            return
+        for connection in self._connections:
+            try:
+                connection.send(None)
+            except (OSError, EOFError):
+                pass
+        for process in self._processes:
+            process.join(timeout=1)
+        for connection in self._connections:
+            connection.close()
+        self._connections = []
+        self._processes = []
@@ -0,0 +1,161 @@
+# sparse_index.py - Backend de busca vetorizado sobre matriz esparsa termo × chunk (opcional)
+import threading
+import logging
+from array import array
+from text_analysis import analyze
+
+logger = logging.getLogger(__name__)
+
+try:
+    import numpy as np
+    from scipy import sparse
+    SPARSE_AVAILABLE = True
+except ImportError:
+    SPARSE_AVAILABLE = False
+
+class SparseIndex:
+    """
+    Corpus armazenado como matriz CSR (chunks × termos) de pesos TF-IDF com saturação BM25
+    Uma consulta (ou um lote de consultas) é pontuada com um único produto matriz-vetor/matriz-matriz,
+    produzindo o mesmo ranking BM25 do InvertedIndex sem posições: trechos entre aspas não restringem
+    o resultado (são buscados como termos soltos) e não há bônus de proximidade, então o ranking
+    difere do InvertedIndex em consultas com mais de um termo
+    Chunks removidos ficam fora da matriz (e das estatísticas) a partir da consulta seguinte;
+    compact() descarta suas triplas
+    """
+
+    def __init__(self, k1=1.2, b=0.75):
+        if not SPARSE_AVAILABLE:
+            raise ImportError("numpy e scipy são necessários para o backend esparso")
+        self.k1 = k1
+        self.b = b
+        self.vocabulary = {}
+        # Triplas (chunk, termo, tf) acumuladas a cada upload; a matriz é reconstruída sob demanda
+        self._rows = array('i')
+        self._cols = array('i')
+        self._tfs = array('i')
+        self._lengths = array('i')
+        # 1 para chunks ativos, 0 para removidos
+        self._live = bytearray()
+        self._num_deleted = 0
+        self._pending_compaction = 0
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    @property
+    def num_chunks(self):
+        return len(self._lengths) - self._num_deleted
+
+    def add(self, chunk_id, tokens, positions=None):
+        """
+        Acrescenta um chunk já analisado (ids crescentes, na ordem do document_store)
+        As posições são ignoradas: a matriz guarda apenas frequências
+        """
+        counts = {}
+        for term in tokens:
+            counts[term] = counts.get(term, 0) + 1
+
+        with self._lock:
+            for term, tf in counts.items():
+                col = self.vocabulary.get(term)
+                if col is None:
+                    col = self.vocabulary[term] = len(self.vocabulary)
+                self._rows.append(chunk_id)
+                self._cols.append(col)
+                self._tfs.append(tf)
+            self._lengths.append(len(tokens))
+            self._live.append(1)
+            self._matrix = None
+
+    def delete(self, chunk_id, tokens=None):
+        """Marca um chunk como removido (mesma interface do InvertedIndex)"""
+        with self._lock:
+            if chunk_id < len(self._live) and self._live[chunk_id]:
+                self._live[chunk_id] = 0
+                self._num_deleted += 1
+                self._pending_compaction += 1
+                self._matrix = None
+
+    def compact(self):
+        """Descarta as triplas dos chunks removidos; retorna a quantidade de chunks compactados"""
+        with self._lock:
+            if not self._pending_compaction:
+                return 0
+            live = np.frombuffer(self._live, dtype=np.uint8).astype(bool)
+            keep = live[np.frombuffer(self._rows, dtype=np.int32)]
+            for name in ('_rows', '_cols', '_tfs'):
+                column = np.frombuffer(getattr(self, name), dtype=np.int32)
+                setattr(self, name, array('i', column[keep].tobytes()))
+            compacted, self._pending_compaction = self._pending_compaction, 0
+            return compacted
+
+    def _build_matrix(self):
+        """Calcula os pesos de todas as entradas de forma vetorizada e monta a matriz CSR"""
+        rows = np.frombuffer(self._rows, dtype=np.int32)
+        cols = np.frombuffer(self._cols, dtype=np.int32)
+        tfs = np.frombuffer(self._tfs, dtype=np.int32).astype(np.float64)
+        lengths = np.frombuffer(self._lengths, dtype=np.int32).astype(np.float64)
+        live = np.frombuffer(self._live, dtype=np.uint8).astype(bool)
+
+        # Triplas de chunks removidos (ainda não compactadas) não entram na matriz nem nas estatísticas
+        keep = live[rows]
+        rows, cols, tfs = rows[keep], cols[keep], tfs[keep]
+
+        num_chunks = int(live.sum())
+        num_terms = len(self.vocabulary)
+        df = np.bincount(cols, minlength=num_terms)
+        idf = np.log1p((num_chunks - df + 0.5) / (df + 0.5))
+        live_lengths = lengths[live]
+        avg_length = live_lengths.mean() if live_lengths.sum() else 1.0
+        norm = self.k1 * (1 - self.b + self.b * lengths[rows] / avg_length)
+        weights = idf[cols] * tfs * (self.k1 + 1) / (tfs + norm)
+
+        return sparse.csr_matrix((weights, (rows, cols)), shape=(len(lengths), num_terms))
+
+    def _query_matrix(self, queries):
+        """Matriz termos × consultas com 1 para cada termo (distinto) presente na consulta"""
+        rows, cols = [], []
+        for position, query in enumerate(queries):
+            for term in set(analyze(query)):
+                col = self.vocabulary.get(term)
+                if col is not None:
+                    rows.append(col)
+                    cols.append(position)
+        data = np.ones(len(rows), dtype=np.float64)
+        return sparse.csc_matrix((data, (rows, cols)), shape=(len(self.vocabulary), len(queries)))
+
+    @staticmethod
+    def _top_k(scores, max_results, min_score_ratio):
+        """Seleciona os k melhores com argpartition, sem ordenar todos os scores"""
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > max_results:
+            partition = np.argpartition(-scores[candidates], max_results - 1)
+            kth_score = scores[candidates[partition[max_results - 1]]]
+            # Mantém todos os empatados com o k-ésimo para desempatar pela ordem de inserção
+            candidates = candidates[scores[candidates] >= kth_score]
+        # Score decrescente; empates pela ordem de inserção
+        top = candidates[np.lexsort((candidates, -scores[candidates]))][:max_results]
+
+        ranked = [(int(chunk_id), float(scores[chunk_id])) for chunk_id in top]
+        if ranked and min_score_ratio > 0:
+            threshold = ranked[0][1] * min_score_ratio
+            ranked = [item for item in ranked if item[1] >= threshold]
+        return ranked
+
+    def search_batch(self, queries, max_results=3, min_score_ratio=0.0):
+        """Pontua um lote de consultas com um único produto esparso matriz × matriz"""
+        with self._lock:
+            if not self.num_chunks or max_results <= 0:
+                return [[] for _ in queries]
+            if self._matrix is None:
+                self._matrix = self._build_matrix()
+            matrix = self._matrix
+            query_matrix = self._query_matrix(queries)
+
+        scores = (matrix @ query_matrix).toarray()
+        return [self._top_k(scores[:, position], max_results, min_score_ratio)
+                for position in range(len(queries))]
+
+    def search(self, query, max_results=3, min_score_ratio=0.0):
+        """Ranking de uma única consulta (mesma interface do InvertedIndex)"""
+        return self.search_batch([query], max_results, min_score_ratio)[0]
@@ -0,0 +1,152 @@
+# test_index_snapshot.py - Segmentos persistidos respondem às consultas como o índice em memória
+import pytest
+
+from index_snapshot import IndexSegment, IndexSnapshots, write_segment
+from search_index import InvertedIndex
+from text_analysis import analyze, analyze_positions, parse_query
+
+CHUNKS = [
+    "O trancamento de matrícula pode ser solicitado até a metade do período letivo.",
+    "O calendário acadêmico define o início do semestre letivo e o prazo de matrícula.",
+    "Bolsas de iniciação científica são concedidas pela pró-reitoria de pesquisa.",
+    "A matrícula de pós-graduação segue o calendário do programa.",
+    "O aluno que não renovar a matrícula perde o vínculo com a universidade.",
+    "Ação afirmativa: reserva de vagas para estudantes de escolas públicas.",
+    "O prazo de trancamento de matrícula termina no dia 15 de abril.",
+    "Semestre letivo de 2024.1: início das aulas em março.",
+]
+
+QUERIES = [
+    "trancamento de matrícula",
+    '"trancamento de matrícula"',
+    "prazo matrícula semestre",
+    '"semestre letivo" início',
+    "bolsas pesquisa",
+    "ação afirmativa vagas",
+    "vínculo universidade",
+]
+
+def build_index(chunks):
+    index = InvertedIndex()
+    for chunk_id, text in enumerate(chunks):
+        index.add(chunk_id, *analyze_positions(text))
+    return index
+
+def delete(index, chunk_id):
+    index.delete(chunk_id, analyze(CHUNKS[chunk_id]))
+
+def assert_same_results(index, other):
+    assert index.num_chunks == other.num_chunks
+    assert index.total_length == other.total_length
+    for query in QUERIES:
+        terms = sorted(set(parse_query(query)[0]))
+        assert other.search_terms(terms, 5) == index.search_terms(terms, 5)
+        assert other.search(query, 5) == index.search(query, 5)
+
+def adopt(index, path):
+    write_segment(index, str(path), len(CHUNKS), 0)
+    adopted = InvertedIndex()
+    adopted.load_segment(IndexSegment(str(path)))
+    return adopted
+
+def test_round_trip_matches_memory_index(tmp_path):
+    index = build_index(CHUNKS)
+    adopted = adopt(index, tmp_path / 'segment')
+
+    assert adopted.postings.memory_terms == 0
+    assert adopted.postings.terms() == index.postings.terms()
+    for term in index.postings.terms():
+        original, loaded = index.postings[term], adopted.postings[term]
+        assert list(loaded.ids) == list(original.ids)
+        assert list(loaded.tfs) == list(original.tfs)
+        assert [list(loaded.positions_at(i)) for i in range(len(loaded))] == \
+               [list(original.positions_at(i)) for i in range(len(original))]
+    assert_same_results(index, adopted)
+
+def test_phrase_requires_adjacent_terms_in_segment(tmp_path):
+    adopted = adopt(build_index(CHUNKS), tmp_path / 'segment')
+    hits = {chunk_id for chunk_id, _ in adopted.search('"trancamento de matrícula"', 10)}
+    assert hits == {0, 6}
+
+@pytest.mark.parametrize('compacted', [False, True])
+def test_adopt_after_deletions(tmp_path, compacted):
+    index = build_index(CHUNKS)
+    for chunk_id in (0, 3):
+        delete(index, chunk_id)
+    if compacted:
+        index.compact()
+
+    adopted = adopt(index, tmp_path / 'segment')
+
+    # Os chunks removidos não vão para o segmento, tenham sido compactados ou não
+    assert list(adopted.lengths)[0] == -1 and list(adopted.lengths)[3] == -1
+    assert not any(chunk_id in (0, 3) for term in adopted.postings.terms()
+                   for chunk_id in adopted.postings[term].ids)
+    assert_same_results(index, adopted)
+
+    # Remoções posteriores à adoção seguem funcionando sobre as listas do segmento
+    delete(index, 6)
+    delete(adopted, 6)
+    assert_same_results(index, adopted)
+    index.compact()
+    assert adopted.compact() == 1
+    assert_same_results(index, adopted)
+
+def test_mutable_copies_segment_lists(tmp_path):
+    index = build_index(CHUNKS[:-1])
+    write_segment(index, str(tmp_path / 'segment'), len(CHUNKS) - 1, 0)
+    segment = IndexSegment(str(tmp_path / 'segment'))
+    first, second = InvertedIndex(), InvertedIndex()
+    first.load_segment(segment)
+    second.load_segment(segment)
+
+    term = analyze('semestre')[0]
+    before = list(segment.postings(term).ids)
+    first.add(len(CHUNKS) - 1, *analyze_positions(CHUNKS[-1]))
+    index.add(len(CHUNKS) - 1, *analyze_positions(CHUNKS[-1]))
+
+    # A lista alterada passa para a memória do índice; o segmento e o outro índice não mudam
+    assert term in first.postings._memory
+    assert list(first.postings[term].ids) == before + [len(CHUNKS) - 1]
+    assert list(segment.postings(term).ids) == before
+    assert list(second.postings[term].ids) == before
+    assert second.postings.memory_terms == 0
+    assert_same_results(index, first)
+
+def test_compaction_removes_segment_terms(tmp_path):
+    index = build_index(CHUNKS)
+    adopted = adopt(index, tmp_path / 'segment')
+    term = analyze('bolsas')[0]
+    assert term in adopted.postings
+
+    delete(adopted, 2)
+    adopted.compact()
+
+    # Termo só presente no chunk removido: some das listas sem alterar o segmento
+    assert term not in adopted.postings
+    assert term not in adopted.postings.terms()
+    assert adopted.postings.segment.postings(term) is not None
+
+def test_snapshots_publish_and_latest(tmp_path):
+    index = build_index(CHUNKS)
+    writer = IndexSnapshots(str(tmp_path / 'index'))
+    reader = IndexSnapshots(str(tmp_path / 'index'))
+    assert reader.latest() is None
+
+    segment = writer.publish(index, len(CHUNKS), 0)
+    assert segment is not None
+    # O processo que publicou já usa o segmento; os demais o encontram uma vez
+    assert writer.latest() is None
+    latest = reader.latest()
+    assert latest is not None and latest.path == segment.path
+    assert reader.latest() is None
+
+    # Um segmento que não é mais atual que o publicado é ignorado
+    assert writer.publish(index, len(CHUNKS), 0) is None
+
+    delete(index, 1)
+    newer = writer.publish(index, len(CHUNKS), 1)
+    assert newer is not None and newer.path != segment.path
+    adopted = InvertedIndex()
+    adopted.load_segment(reader.latest())
+    assert_same_results(index, adopted)
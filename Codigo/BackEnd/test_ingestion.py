@@ -0,0 +1,44 @@
+# test_ingestion.py - Divisão incremental de uma nova versão de documento
+from ingestion import FixedSizeSplitter, IncrementalSplitter, match_pages, split_text_spans
+
+OLD_PAGES = [f'pagina {number} ' + 'texto ' * 300 for number in range(40)]
+
+def split_version(old_pages, new_pages):
+    splitter = IncrementalSplitter([len(text) for text in old_pages], split_text_spans(''.join(old_pages)),
+                                   match_pages(old_pages, new_pages))
+    spans, released, retained = [], 0, 0
+    for text in new_pages:
+        for span in splitter.feed(text):
+            # Nenhum chunk referencia texto já liberado pelo divisor
+            assert span[0] >= released
+            spans.append(span)
+        released = splitter.retain_from
+        retained = max(retained, splitter.length - released)
+    spans.extend(splitter.finish())
+    return sorted(spans), splitter.kept_count, retained
+
+def test_unchanged_document_keeps_every_chunk():
+    spans, kept, _ = split_version(OLD_PAGES, OLD_PAGES)
+    assert spans == split_text_spans(''.join(OLD_PAGES))
+    assert kept == len(spans)
+
+def test_inserted_pages_keep_chunks_and_bound_retention():
+    new_pages = OLD_PAGES[:10] + ['novo ' * 400] * 5 + OLD_PAGES[10:]
+    spans, kept, retained = split_version(OLD_PAGES, new_pages)
+
+    text = ''.join(new_pages)
+    inserted_start = sum(len(page) for page in OLD_PAGES[:10])
+    inserted_end = inserted_start + 5 * len('novo ' * 400)
+    # Os chunks das páginas inalteradas são os da versão anterior, deslocados
+    old_spans = split_text_spans(''.join(OLD_PAGES))
+    assert kept >= len(old_spans) - 4
+    assert all(span in spans for span in old_spans if span[1] <= inserted_start)
+    # Todo o texto é coberto e o trecho inserido é dividido com o tamanho do divisor
+    covered = [False] * len(text)
+    for start, end in spans:
+        assert end - start <= FixedSizeSplitter().chunk_size
+        covered[start:end] = [True] * (end - start)
+    assert all(covered)
+    assert any(inserted_start <= start and end <= inserted_end for start, end in spans)
+    # Só a janela ainda referenciável fica retida, não o documento inteiro
+    assert retained < FixedSizeSplitter().chunk_size
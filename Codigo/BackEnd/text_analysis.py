@@ -0,0 +1,88 @@
+# text_analysis.py - Análise de texto em português para indexação e busca
+import re
+import unicodedata
+
+_TOKEN_RE = re.compile(r'\w+')
+
+# Trechos entre aspas (retas ou tipográficas) de uma consulta são buscados como frase
+_PHRASE_RE = re.compile(r'["“”]([^"“”]+)["“”]')
+
+# Palavras funcionais do português (já sem acentos), ignoradas na indexação e nas consultas
+STOPWORDS = frozenset('''
+a ao aos aquela aquelas aquele aqueles aquilo as ate com como da das de dela delas dele deles
+depois do dos e ela elas ele eles em entre era eram essa essas esse esses esta estas este estes
+eu foi foram ha isso isto ja lhe lhes mais mas me mesmo meu minha muito na nas nem no nos nossa
+nosso num numa o os ou para pela pelas pelo pelos por qual quando que quem se sem ser seu seus
+so sua suas tambem te tem tu tua um uma umas uns voce voces
+'''.split())
+
+def fold_accents(text):
+    """Remove acentos e diacríticos (matrícula → matricula, nº → no)"""
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+def light_stem(token):
+    """
+    Stemmer leve para português: reduz plurais e remove a vogal temática final
+    Agressivo o suficiente para unir singular/plural e masculino/feminino, sem o custo de um RSLP completo
+    """
+    if len(token) < 4 or token.isdigit():
+        return token
+
+    # Plurais
+    if token.endswith(('oes', 'aes')):
+        token = token[:-3] + 'ao'
+    elif len(token) > 4 and token.endswith('ais'):
+        token = token[:-2] + 'l'
+    elif len(token) > 4 and token.endswith('eis'):
+        token = token[:-3] + 'el'
+    elif len(token) > 4 and token.endswith('ois'):
+        token = token[:-3] + 'ol'
+    elif token.endswith('res'):
+        token = token[:-2]
+    elif token.endswith('ns'):
+        token = token[:-2] + 'm'
+    elif token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        token = token[:-1]
+
+    # Vogal temática (gênero)
+    if len(token) > 4 and token[-1] in 'aeo':
+        token = token[:-1]
+
+    return token
+
+def analyze(text):
+    """
+    Pipeline de análise: minúsculas → remoção de acentos → tokenização → stopwords → stemming
+    Usado uma vez por chunk na ingestão e apenas sobre a pergunta no momento da busca
+    """
+    tokens = _TOKEN_RE.findall(fold_accents(text.lower()))
+    return [light_stem(token) for token in tokens if token not in STOPWORDS]
+
+def analyze_positions(text):
+    """
+    Termos analisados e suas posições na sequência de tokens do texto
+    Stopwords não geram termos, mas ocupam posição: "trancamento de matrícula" → posições 0 e 2
+    """
+    terms = []
+    positions = []
+    for position, token in enumerate(_TOKEN_RE.findall(fold_accents(text.lower()))):
+        if token not in STOPWORDS:
+            terms.append(light_stem(token))
+            positions.append(position)
+    return terms, positions
+
+def parse_query(query):
+    """
+    Análise posicional de uma consulta: (termos, posições, frases)
+    Cada frase entre aspas é uma lista de (termo, deslocamento em relação ao primeiro termo);
+    frases de um único termo não restringem nada e são ignoradas
+    """
+    terms, positions = analyze_positions(query)
+    phrases = []
+    for match in _PHRASE_RE.finditer(query):
+        phrase_terms, phrase_positions = analyze_positions(match.group(1))
+        if len(phrase_terms) > 1:
+            phrases.append([(term, position - phrase_positions[0])
+                            for term, position in zip(phrase_terms, phrase_positions)])
+    return terms, positions, phrases
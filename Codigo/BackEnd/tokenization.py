@@ -0,0 +1,37 @@
+# tokenization.py - Contagem local de tokens para dimensionar chunks e prompts
+import re
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tokenizador BPE local (opcional); sem ele, a contagem é estimada
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+_PIECE_RE = re.compile(r'\w+|[^\w\s]')
+
+class TokenCounter:
+    """
+    Conta tokens sem chamada de rede
+    Com o tiktoken usa um encoding BPE (cl100k_base é próximo do tokenizador do llama3, que também
+    é um BPE no formato do tiktoken); sem ele, estima um token por símbolo de pontuação e um a cada
+    4 caracteres de cada palavra, o que superestima levemente o texto em português
+    """
+
+    def __init__(self, encoding_name='cl100k_base'):
+        self.encoding = None
+        if TIKTOKEN_AVAILABLE:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding_name)
+            except Exception as e:
+                logger.warning(f"Encoding {encoding_name} indisponível, usando estimativa de tokens: {e}")
+        self.name = encoding_name if self.encoding is not None else 'estimate'
+
+    def count(self, text):
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return sum(math.ceil(len(piece) / 4) for piece in _PIECE_RE.findall(text))
@@ -183,25 +183,48 @@ const handleSendMessage = useCallback(async () => {
 
   try {
     let response;
+    const botId = Date.now() + 1;
+    const sourceLabel = (sources) => sources && sources.length > 0
+      ? sources.map(s => s['nome do arquivo']).join(', ')
+      : "Documentos da UFMA";
     
     // SEMPRE usar chat público primeiro (não precisa de token)
+    // A resposta chega aos poucos: a mensagem do bot aparece com as fontes e cresce a cada fragmento
     console.log('📤 Usando chat público...');
-    response = await authService.sendPublicMessage(messageToSend);
+    response = await authService.streamPublicMessage(messageToSend, {
+      onSources: (data) => {
+        setChatMessages(prev => [...prev, {
+          id: botId,
+          type: 'bot',
+          content: '',
+          source: sourceLabel(data.sources),
+          timestamp: new Date(),
+          feedback: null,
+          authenticated: false // Sempre público por enquanto
+        }]);
+        setIsLoading(false);
+      },
+      onToken: (answer) => {
+        setChatMessages(prev => prev.map(msg => 
+          msg.id === botId ? { ...msg, content: answer } : msg
+        ));
+      }
+    });
     
     if (response.success) {
       const botMessage = {
-        id: Date.now() + 1,
+        id: botId,
         type: 'bot',
         content: response.data.answer,
-        source: response.data.sources && response.data.sources.length > 0 
-          ? response.data.sources.map(s => s['nome do arquivo']).join(', ')
-          : "Documentos da UFMA",
+        source: sourceLabel(response.data.sources),
         timestamp: new Date(),
         feedback: null,
         authenticated: false // Sempre público por enquanto
       };
 
-      setChatMessages(prev => [...prev, botMessage]);
+      setChatMessages(prev => prev.some(msg => msg.id === botId)
+        ? prev.map(msg => msg.id === botId ? botMessage : msg)
+        : [...prev, botMessage]);
       
       // Atualizar histórico do usuário
       setUserHistory(prev => [...prev, {
@@ -212,14 +235,15 @@ const handleSendMessage = useCallback(async () => {
       }]);
     } else {
       const errorMessage = {
-        id: Date.now() + 1,
+        id: botId,
         type: 'bot',
         content: `Erro: ${response.message}`,
         source: "Sistema - Erro",
         timestamp: new Date(),
         feedback: null
       };
-      setChatMessages(prev => [...prev, errorMessage]);
+      // Uma resposta interrompida é substituída pela mensagem de erro
+      setChatMessages(prev => [...prev.filter(msg => msg.id !== botId), errorMessage]);
     }
     
   } catch (error) {
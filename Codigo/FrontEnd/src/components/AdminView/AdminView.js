@@ -24,6 +24,7 @@ const AdminView = ({
 }) => {
   const [uploadProgress, setUploadProgress] = useState(0);
   const [isUploading, setIsUploading] = useState(false);
+  const [processingInfo, setProcessingInfo] = useState('');
   const [documents, setDocuments] = useState([]);
   const [users, setUsers] = useState([]);
   const [systemStats, setSystemStats] = useState(null);
@@ -62,12 +63,12 @@ const AdminView = ({
       if (result.success) {
         // Converter dados dos documentos para formato compatível
         const docs = result.data.documents.map((doc, index) => ({
-          id: index + 1,
+          id: doc.document_id !== undefined ? doc.document_id : index + 1,
           title: doc.filename.replace('.pdf', ''),
           version: 'v1.0',
           lastUpdated: doc.upload_date ? new Date(doc.upload_date).toLocaleDateString() : new Date().toLocaleDateString(),
           isActive: true,
-          size: `${(doc.chunks * 1000 / (1024)).toFixed(1)} KB`,
+          size: `${((doc.file_size || doc.chunks * 1000) / 1024).toFixed(1)} KB`,
           chunks: doc.chunks,
           uploadedBy: doc.uploaded_by || 'Sistema',
           downloadUrl: '#'
@@ -118,7 +119,11 @@ const AdminView = ({
         });
       }, 200);
 
-      const result = await authService.uploadDocument(file);
+      const result = await authService.uploadDocument(file, (job) => {
+        setProcessingInfo(job.status === 'queued'
+          ? 'Aguardando na fila de processamento'
+          : `${job.pages_processed} páginas, ${job.chunks} chunks`);
+      });
       
       clearInterval(progressInterval);
       setUploadProgress(100);
@@ -156,6 +161,7 @@ const AdminView = ({
     
     setIsUploading(false);
     setUploadProgress(0);
+    setProcessingInfo('');
   };
 
   // Lidar com seleção de arquivo no modal
@@ -602,7 +608,9 @@ const AdminView = ({
                     ></div>
                   </div>
                   <p className="progress-text">
-                    {uploadProgress < 100 ? `Enviando... ${uploadProgress}%` : 'Processando documento...'}
+                    {processingInfo
+                      ? `Processando documento... ${processingInfo}`
+                      : uploadProgress < 100 ? `Enviando... ${uploadProgress}%` : 'Processando documento...'}
                   </p>
                 </div>
               )}
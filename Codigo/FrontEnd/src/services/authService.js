@@ -12,6 +12,13 @@ const api = axios.create({
   },
 });
 
+// Consulta dos jobs de upload: intervalo entre consultas, tempo máximo sem progresso
+// (job perdido, ex.: servidor reiniciado) e tempo máximo de processamento; a espera na fila
+// não conta para nenhum dos dois (um job abandonado na fila é dado como falha pelo servidor)
+const UPLOAD_POLL_INTERVAL_MS = 1000;
+const UPLOAD_STALL_TIMEOUT_MS = 2 * 60 * 1000;
+const UPLOAD_MAX_WAIT_MS = 30 * 60 * 1000;
+
 // Interceptor para adicionar token automaticamente nas requisições
 api.interceptors.request.use(
   (config) => {
@@ -335,6 +342,86 @@ class AuthService {
     }
   }
 
+  // Enviar mensagem para o chat público recebendo a resposta aos poucos (Server-Sent Events)
+  // onSources(dados) é chamado com as fontes antes da resposta; onToken(textoAtéAgora) a cada fragmento
+  async streamPublicMessage(question, { onSources, onToken } = {}) {
+    try {
+      // fetch em vez de axios: o axios no navegador só entrega o corpo completo
+      const response = await fetch(`${API_BASE_URL}/chat/stream`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ question })
+      });
+
+      if (!response.ok || !response.body) {
+        const data = await response.json().catch(() => ({}));
+        return {
+          success: false,
+          message: data.error || 'Erro ao enviar mensagem'
+        };
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let answer = '';
+      let result = { sources: [], context: '' };
+
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Eventos SSE são separados por uma linha em branco
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+          const rawEvent = buffer.slice(0, boundary);
+          buffer = buffer.slice(boundary + 2);
+
+          let event = 'message';
+          let payload = '';
+          rawEvent.split('\n').forEach(line => {
+            if (line.startsWith('event:')) event = line.slice(6).trim();
+            else if (line.startsWith('data:')) payload += line.slice(5).trim();
+          });
+          const data = payload ? JSON.parse(payload) : {};
+
+          if (event === 'sources') {
+            result = { ...result, ...data };
+            if (onSources) onSources(data);
+          } else if (event === 'token') {
+            answer += data.content;
+            if (onToken) onToken(answer);
+          } else if (event === 'done') {
+            reader.cancel();
+            return {
+              success: true,
+              data: { ...result, answer, cached: data.cached }
+            };
+          } else if (event === 'error') {
+            return {
+              success: false,
+              message: data.error
+            };
+          }
+        }
+      }
+
+      // Sem o evento 'done' a resposta está incompleta (conexão caiu ou o servidor foi interrompido)
+      return {
+        success: false,
+        message: 'A conexão foi interrompida antes do fim da resposta'
+      };
+
+    } catch (error) {
+      console.error('Erro no chat público (stream):', error);
+      return {
+        success: false,
+        message: 'Erro ao enviar mensagem'
+      };
+    }
+  }
+
   // Listar documentos (com ou sem auth)
   async getDocuments() {
     try {
@@ -353,7 +440,8 @@ class AuthService {
   }
 
   // Upload de documento (apenas admin)
-  async uploadDocument(file) {
+  // O servidor processa o PDF em segundo plano; o job é consultado até terminar
+  async uploadDocument(file, onProgress) {
     try {
       const formData = new FormData();
       formData.append('file', file);
@@ -364,9 +452,49 @@ class AuthService {
         },
       });
 
+      let job = response.data;
+      let startedAt = null;
+      let lastProgress = null;
+      let lastProgressAt = null;
+      while (job.status !== 'done' && job.status !== 'failed') {
+        const now = Date.now();
+        if (job.status === 'queued') {
+          // Aguardando outros PDFs na fila: o estado não muda, mas não é falta de progresso
+          lastProgress = null;
+        } else {
+          const progress = `${job.status}:${job.pages_processed}:${job.chunks}`;
+          if (startedAt === null) {
+            startedAt = now;
+          }
+          if (progress !== lastProgress) {
+            lastProgress = progress;
+            lastProgressAt = now;
+          }
+          if (now - lastProgressAt > UPLOAD_STALL_TIMEOUT_MS || now - startedAt > UPLOAD_MAX_WAIT_MS) {
+            return {
+              success: false,
+              message: 'O processamento do PDF não respondeu a tempo; verifique a lista de documentos ou envie o arquivo novamente'
+            };
+          }
+        }
+
+        await new Promise(resolve => setTimeout(resolve, UPLOAD_POLL_INTERVAL_MS));
+        job = (await api.get(`/upload/jobs/${response.data.job_id}`)).data;
+        if (onProgress) {
+          onProgress(job);
+        }
+      }
+
+      if (job.status === 'failed') {
+        return {
+          success: false,
+          message: job.error || 'Erro ao processar PDF'
+        };
+      }
+
       return {
         success: true,
-        data: response.data
+        data: job
       };
       
     } catch (error) {